@@ -0,0 +1 @@
+Syndication profiles are parsed once at startup and cached. Use `ckanext.syndicate.utils.reset_profiles` after changing profile options at runtime
@@ -0,0 +1 @@
+Optional asynchronous syndication mode, that sends requests to remote portals concurrently
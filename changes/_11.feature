@@ -0,0 +1 @@
+Dataset is loaded only once when it's syndicated to multiple profiles
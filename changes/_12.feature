@@ -0,0 +1 @@
+Profiles can limit syndicated fields of the dataset, so that dataset is loaded without `package_show`
@@ -0,0 +1 @@
+Syndication metrics can be exported to StatsD or Prometheus
@@ -0,0 +1 @@
+Benchmarks of syndication against the local stand-in remote portal with configurable latency
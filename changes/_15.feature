@@ -0,0 +1 @@
+Rate limiter and circuit breaker for remote portals. Syndication to the unavailable portal is deferred
@@ -0,0 +1 @@
+Syndication jobs can be sent to dedicated queues per profile, with the separate lane for bulk syndication
@@ -0,0 +1 @@
+`ckan syndicate sync --incremental` syndicates only datasets modified after the last syndication
@@ -0,0 +1 @@
+Eligibility of datasets for bulk syndication is checked in SQL. New ISyndicate.filter_syndicated_packages hook
@@ -0,0 +1 @@
+Files of uploaded resources can be copied to the remote portal
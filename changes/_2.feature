@@ -0,0 +1 @@
+Predicates of syndication profiles are imported at startup. Misconfigured predicates raise an error instead of breaking notifications
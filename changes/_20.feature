@@ -0,0 +1 @@
+Resources of the remote dataset can be updated individually, instead of being replaced on every update
@@ -0,0 +1 @@
+Images of replicated organizations are uploaded by the separate job and external images are cached on disk
@@ -0,0 +1 @@
+New `ckan syndicate reconcile` command, that syndicates only datasets that differ on local and remote portals
@@ -0,0 +1 @@
+Syndications can be recorded in the DB outbox and enqueued by `ckan syndicate dispatch`, so that web requests do not depend on the job queue
@@ -0,0 +1 @@
+Failed syndications are retried with exponential backoff and stored for replay via `ckan syndicate failures` when retries are exhausted
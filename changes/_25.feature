@@ -0,0 +1 @@
+Implementations of ISyndicate and legacy syndication actions are resolved once instead of on every syndication
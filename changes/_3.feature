@@ -0,0 +1 @@
+Repeated changes of the dataset waiting for syndication are coalesced into a single job when `ckanext.syndicate.debounce_window` is enabled
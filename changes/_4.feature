@@ -0,0 +1 @@
+`ckan syndicate sync --foreground` synchronizes datasets in the current process using multiple threads and rate limits per remote portal
@@ -0,0 +1 @@
+Connections to remote portals are pooled and reused
@@ -0,0 +1 @@
+IDs of organizations replicated to remote portals are cached
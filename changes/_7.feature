@@ -0,0 +1 @@
+Remote datasets are not updated when syndicated data did not change since the previous syndication
@@ -0,0 +1 @@
+Deleted datasets are removed from remote portals
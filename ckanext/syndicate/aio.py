@@ -0,0 +1,364 @@
+"""Asynchronous syndication of multiple packages and profiles.
+
+Local data is loaded and prepared synchronously, using the same hooks as
+regular syndication. Only requests to remote portals are sent concurrently,
+with the limited number of simultaneous requests to the same host. Rare
+cases(conflicting names, stale IDs of remote packages) are handled by
+regular synchronous syndication.
+
+Requires `httpx`.
+
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+from collections import Counter
+from typing import Any, Iterable, Optional
+from urllib.parse import urlparse
+
+import ckan.plugins.toolkit as tk
+import ckanapi
+from ckan import model
+from ckanapi.common import reverse_apicontroller_action
+
+from . import limits, metrics, resources, tasks, utils
+from .model import STATUS_DELETED, SyncState
+from .types import Profile, Topic
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+CONFIG_ENABLED = "ckanext.syndicate.async.enabled"
+CONFIG_HOST_CONCURRENCY = "ckanext.syndicate.async.host_concurrency"
+CONFIG_TIMEOUT = "ckanext.syndicate.async.timeout"
+
+DEFAULT_HOST_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 30
+
+log = logging.getLogger(__name__)
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_ENABLED, False))
+
+
+class AsyncRemoteCKAN:
+    """Minimal asynchronous alternative to ckanapi.RemoteCKAN."""
+
+    def __init__(
+        self,
+        client: Any,
+        address: str,
+        apikey: str,
+        semaphore: asyncio.Semaphore,
+    ):
+        self.client = client
+        self.address = address.rstrip("/")
+        self.apikey = apikey
+        self.semaphore = semaphore
+
+    async def call_action(self, action: str, data_dict: dict[str, Any]):
+        url = f"{self.address}/api/action/{action}"
+        headers = {}
+        if self.apikey:
+            headers["Authorization"] = self.apikey
+
+        async with self.semaphore:
+            resp = await self.client.post(url, json=data_dict, headers=headers)
+
+        return reverse_apicontroller_action(url, resp.status_code, resp.text)
+
+
+class _Job:
+    def __init__(
+        self,
+        package_id: str,
+        topic: Topic,
+        profile: Profile,
+        action: str,
+        payload: dict[str, Any],
+        payload_hash: Optional[str] = None,
+    ):
+        self.package_id = package_id
+        self.topic = topic
+        self.profile = profile
+        self.action = action
+        self.payload = payload
+        self.payload_hash = payload_hash
+
+        self.result: Optional[dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self.transient = False
+        self.fallback = False
+
+
+@metrics.job("sync_batch")
+def sync_batch(
+    items: Iterable[tuple[str, Topic, Profile]], pending: bool = False
+) -> Counter[str]:
+    """Syndicate multiple packages to multiple profiles concurrently.
+
+    When `pending` flag is set, topics are taken from the debouncer.
+
+    """
+    counters, errors = syndicate(items, pending)
+    if errors:
+        # mark RQ job as failed
+        raise errors[0]
+
+    return counters
+
+
+def syndicate(
+    items: Iterable[tuple[str, Topic, Profile]], pending: bool = False
+) -> tuple[Counter[str], list[Exception]]:
+    """Syndicate items and return stats and errors, without raising them."""
+    counters: Counter[str] = Counter()
+    errors: list[Exception] = []
+    jobs = []
+    fallback = []
+    packages: dict[str, dict[str, Any]] = {}
+
+    items = list(_resolve_topics(items, pending))
+    if httpx is None:
+        log.warning("httpx is not installed. Syndicate synchronously")
+        fallback.extend((*item, False) for item in items)
+        items = []
+
+    fields = tasks.get_snapshot_fields(profile for _, _, profile in items)
+
+    for package_id, topic, profile in items:
+        if topic is Topic.delete:
+            fallback.append((package_id, topic, profile, False))
+            continue
+
+        # failure of one item must not abort the whole batch
+        try:
+            if package_id not in packages:
+                packages[package_id] = tasks.load_package(package_id, fields)
+
+            package = packages[package_id]
+            if package["state"] == model.State.DELETED:
+                counters["skipped"] += 1
+                continue
+
+            job = _make_job(package, topic, profile)
+            if job is None:
+                fallback.append((package_id, topic, profile, False))
+            elif job.action:
+                tasks._notify_before(package_id, profile, {"id": package_id})
+                jobs.append(job)
+            else:
+                counters["skipped"] += 1
+
+        except limits.RemoteUnavailable as e:
+            model.Session.rollback()
+            tasks._defer([package_id], topic, profile, e)
+            counters["deferred"] += 1
+        except Exception as e:
+            log.exception(
+                "Cannot syndicate %s for profile %s", package_id, profile.id
+            )
+            model.Session.rollback()
+            if not isinstance(e, tk.ObjectNotFound):
+                tasks.schedule_retry([package_id], topic, profile, e)
+            counters["failed"] += 1
+            errors.append(e)
+
+    asyncio.run(_execute(jobs))
+
+    for job in jobs:
+        if job.fallback:
+            # before_syndication was sent when the job was created
+            fallback.append((job.package_id, job.topic, job.profile, True))
+        elif job.error:
+            log.error(
+                "Cannot syndicate %s for profile %s: %s",
+                job.package_id,
+                job.profile.id,
+                job.error,
+            )
+            tasks.schedule_retry(
+                [job.package_id],
+                job.topic,
+                job.profile,
+                job.error,
+                job.transient,
+            )
+            counters["failed"] += 1
+            errors.append(job.error)
+        else:
+            assert job.result is not None
+            tasks.save_sync_state(
+                job.package_id, job.profile, job.result, job.payload_hash
+            )
+            tasks._notify_after(
+                job.package_id, job.profile, {"id": job.package_id}
+            )
+            counters["synced"] += 1
+
+    for package_id, topic, profile, notified in fallback:
+        try:
+            synced = tasks.sync_package(
+                package_id, topic, profile, notified=notified
+            )
+        except Exception as e:
+            log.exception(
+                "Cannot syndicate %s for profile %s", package_id, profile.id
+            )
+            model.Session.rollback()
+            counters["failed"] += 1
+            errors.append(e)
+        else:
+            counters["synced" if synced else "deferred"] += 1
+
+    return counters, errors
+
+
+def _resolve_topics(
+    items: Iterable[tuple[str, Topic, Profile]], pending: bool
+) -> Iterable[tuple[str, Topic, Profile]]:
+    for package_id, topic, profile in items:
+        if pending:
+            topic = utils.pop_pending(package_id, profile)
+            if topic is None:
+                continue
+        yield package_id, topic, profile
+
+
+def _make_job(
+    package: dict[str, Any], topic: Topic, profile: Profile
+) -> Optional[_Job]:
+    """Prepare data for the remote portal.
+
+    Returns `None` if package must be syndicated synchronously and job
+    without action if remote package is up-to-date.
+
+    """
+    if resources.uploads_enabled(profile) or resources.diff_enabled(profile):
+        # files are streamed and resources diffed by the synchronous client
+        return None
+
+    state = SyncState.get(package["id"], profile.id)
+    if state and state.status == STATUS_DELETED:
+        state = None
+
+    payload = copy.deepcopy(package)
+
+    if state and state.remote_id and state.remote_name:
+        payload["id"] = state.remote_id
+        payload["name"] = state.remote_name
+        payload = tasks._prepare(package["id"], payload, profile)
+
+        payload_hash = utils.compute_payload_hash(payload)
+        if payload_hash == state.payload_hash:
+            utils.count_skipped_write(profile)
+            state.touch()
+            model.Session.commit()
+            return _Job(package["id"], topic, profile, "", payload)
+
+        return _Job(
+            package["id"],
+            topic,
+            profile,
+            "package_update",
+            payload,
+            payload_hash,
+        )
+
+    if tasks.get_syndicated_id(package, profile):
+        # syndicated by old version of extension
+        return None
+
+    del payload["id"]
+    payload["name"] = tasks._compute_remote_name(package, profile)
+    payload = tasks._prepare(package["id"], payload, profile)
+    return _Job(package["id"], topic, profile, "package_create", payload)
+
+
+async def _execute(jobs: list[_Job]):
+    if not jobs:
+        return
+
+    limit = tk.asint(
+        tk.config.get(CONFIG_HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY)
+    )
+    timeout = float(tk.config.get(CONFIG_TIMEOUT, DEFAULT_TIMEOUT))
+    semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        await asyncio.gather(
+            *[_run(client, job, semaphores, limit) for job in jobs]
+        )
+
+
+async def _run(
+    client: Any,
+    job: _Job,
+    semaphores: dict[str, asyncio.Semaphore],
+    limit: int,
+):
+    host = urlparse(job.profile.ckan_url).netloc
+    if host not in semaphores:
+        semaphores[host] = asyncio.Semaphore(limit)
+
+    ckan = AsyncRemoteCKAN(
+        client, job.profile.ckan_url, job.profile.api_key, semaphores[host]
+    )
+    try:
+        failing = await _acquire(job.profile.ckan_url)
+    except limits.RemoteUnavailable:
+        # synchronous syndication defers the job
+        job.fallback = True
+        return
+
+    try:
+        job.result = await ckan.call_action(job.action, job.payload)
+    except Exception as e:
+        job.transient = isinstance(
+            e, httpx.TransportError
+        ) or limits.is_failure(e)
+        if job.transient:
+            limits.record_failure(job.profile.ckan_url)
+        elif failing:
+            limits.record_success(job.profile.ckan_url)
+        _handle_error(job, e)
+    else:
+        if failing:
+            limits.record_success(job.profile.ckan_url)
+
+
+async def _acquire(url: str) -> bool:
+    """Non-blocking version of limits.acquire."""
+    failing = limits.check_circuit(url)
+
+    max_wait = float(
+        tk.config.get(limits.CONFIG_MAX_WAIT, limits.DEFAULT_MAX_WAIT)
+    )
+    waited = 0.0
+    while True:
+        wait = limits.reserve(url)
+        if not wait:
+            return failing
+
+        if waited + wait > max_wait:
+            raise limits.RemoteUnavailable(url, wait, "rate limit exceeded")
+
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+def _handle_error(job: _Job, error: Exception):
+    if isinstance(error, ckanapi.NotFound):
+        # remote package was removed
+        job.fallback = True
+    elif isinstance(
+        error, ckanapi.ValidationError
+    ) and "That URL is already in use." in error.error_dict.get("name", []):
+        job.fallback = True
+    else:
+        job.error = error
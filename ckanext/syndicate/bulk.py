@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Collection, Iterable, Iterator, Optional
+
+import ckan.model as model
+import flask
+import sqlalchemy as sa
+
+from . import aio, hooks, tasks, utils
+from .model import SyncState
+from .types import Profile, Topic
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Keep minimal interval between consecutive calls."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if self.interval <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Stats:
+    """Counters of the bulk syndication."""
+
+    def __init__(self):
+        self.packages = 0
+        self.counters: Counter[str] = Counter()
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished or time.monotonic()
+        return end - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Number of processed packages per second."""
+        if not self.elapsed:
+            return 0.0
+        return self.packages / self.elapsed
+
+    def __str__(self):
+        return (
+            "Processed {packages} packages in {elapsed:.1f}s({rate:.2f}"
+            " packages/s): {synced} synchronized, {skipped} skipped,"
+            " {failed} failed".format(
+                packages=self.packages,
+                elapsed=self.elapsed,
+                rate=self.throughput,
+                synced=self.counters["synced"],
+                skipped=self.counters["skipped"],
+                failed=self.counters["failed"],
+            )
+        )
+
+
+def iter_package_ids(
+    query: Optional[Any] = None, chunk_size: int = 1000
+) -> Iterator[str]:
+    """Stream package IDs using keyset pagination.
+
+    Only one chunk of IDs is kept in memory and no ORM objects are created.
+
+    """
+    if query is None:
+        query = model.Session.query(model.Package.id)
+    query = query.order_by(model.Package.id)
+
+    last_id = None
+    while True:
+        chunk = query
+        if last_id is not None:
+            chunk = chunk.filter(model.Package.id > last_id)
+        ids = [id_ for (id_,) in chunk.limit(chunk_size)]
+        if not ids:
+            return
+
+        yield from ids
+        last_id = ids[-1]
+
+
+def eligible_packages_query(profile: Profile) -> Any:
+    """Query IDs of packages that must be syndicated to the profile.
+
+    Filters are provided by `ISyndicate.filter_syndicated_packages`. If
+    plugin overrides only `skip_syndication`, query is not filtered and
+    packages are checked one by one by `eligible_package_ids`.
+
+    """
+    pipeline = hooks.get_pipeline()
+    query = model.Session.query(model.Package.id)
+    if pipeline.check_each_package:
+        return query
+    return pipeline.skipper.filter_syndicated_packages(query, profile)
+
+
+def eligible_package_ids(
+    profile: Profile, package_ids: Collection[str]
+) -> set[str]:
+    """Select packages that must be syndicated to the profile."""
+    query = eligible_packages_query(profile).filter(
+        model.Package.id.in_(package_ids)
+    )
+    ids = {id_ for (id_,) in query}
+
+    pipeline = hooks.get_pipeline()
+    if pipeline.check_each_package:
+        packages = model.Session.query(model.Package).filter(
+            model.Package.id.in_(ids)
+        )
+        return {
+            pkg.id
+            for pkg in packages
+            if not pipeline.skipper.skip_syndication(pkg, profile)
+        }
+
+    predicate = utils.get_predicate(profile)
+    if predicate and ids:
+        packages = model.Session.query(model.Package).filter(
+            model.Package.id.in_(ids)
+        )
+        ids = {pkg.id for pkg in packages if predicate(pkg)}
+
+    return ids
+
+
+def iter_eligible(
+    package_ids: Iterable[str],
+    profiles: Iterable[Profile],
+    chunk_size: int = 1000,
+) -> Iterator[tuple[str, list[Profile]]]:
+    """Pair every package with profiles it must be syndicated to.
+
+    Eligibility is checked by a single query per chunk of packages and
+    profile.
+
+    """
+    profiles = tuple(profiles)
+    package_ids = iter(package_ids)
+    while True:
+        chunk = list(itertools.islice(package_ids, chunk_size))
+        if not chunk:
+            return
+
+        eligible = {
+            profile.id: eligible_package_ids(profile, chunk)
+            for profile in profiles
+        }
+        for id_ in chunk:
+            yield id_, [p for p in profiles if id_ in eligible[p.id]]
+
+
+def changed_packages_query(profile: Profile) -> Any:
+    """Query IDs of packages modified since the last syndication.
+
+    Only active packages, eligible for syndication to the profile, are
+    selected. Packages that were never syndicated are included.
+
+    """
+    state = sa.and_(
+        SyncState.package_id == model.Package.id,
+        SyncState.profile_id == profile.id,
+    )
+
+    return (
+        eligible_packages_query(profile)
+        .outerjoin(SyncState, state)
+        .filter(
+            model.Package.state == model.State.ACTIVE,
+            sa.or_(
+                SyncState.last_synced_at.is_(None),
+                model.Package.metadata_modified > SyncState.last_synced_at,
+            ),
+        )
+    )
+
+
+def sync_packages(
+    package_ids: Iterable[str],
+    profiles: Iterable[Profile],
+    workers: int = 1,
+    interval: float = 0,
+    on_progress: Optional[Callable[[str], Any]] = None,
+    force: bool = False,
+) -> Stats:
+    """Synchronize packages in the current process.
+
+    Packages are processed by a pool of `workers` threads. `interval` is the
+    minimal number of seconds between two syndications sent to the same
+    remote portal. `force` disables detection of unchanged packages.
+
+    """
+    profiles = tuple(profiles)
+    limiters: defaultdict[str, RateLimiter] = defaultdict(
+        lambda: RateLimiter(interval)
+    )
+    # create limiters before threads are started
+    for profile in profiles:
+        limiters[profile.ckan_url]
+
+    stats = Stats()
+    # do not fill the queue of executor with all the packages
+    backlog = max(workers, 1) * 2
+    pending = set()
+
+    def collect(futures):
+        for future in futures:
+            package_id, counters = future.result()
+            stats.packages += 1
+            stats.counters.update(counters)
+            if on_progress:
+                on_progress(package_id)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for package_id, eligible in iter_eligible(package_ids, profiles):
+            stats.counters["skipped"] += len(profiles) - len(eligible)
+            if not eligible:
+                stats.packages += 1
+                if on_progress:
+                    on_progress(package_id)
+                continue
+
+            if len(pending) >= backlog:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            pending.add(
+                executor.submit(
+                    _with_context(_sync_package),
+                    package_id,
+                    eligible,
+                    limiters,
+                    force,
+                )
+            )
+        collect(wait(pending).done)
+
+    stats.finished = time.monotonic()
+    return stats
+
+
+def sync_packages_async(
+    package_ids: Iterable[str],
+    profiles: Iterable[Profile],
+    batch_size: int = 100,
+    on_progress: Optional[Callable[[str], Any]] = None,
+    force: bool = False,
+) -> Stats:
+    """Synchronize batches of packages concurrently, using asyncio."""
+    profiles = tuple(profiles)
+    stats = Stats()
+
+    batch: list[str] = []
+    for package_id in itertools.chain(package_ids, [None]):
+        if package_id is not None:
+            batch.append(package_id)
+            if len(batch) < batch_size:
+                continue
+
+        items = []
+        for id_, eligible in iter_eligible(batch, profiles, batch_size):
+            stats.counters["skipped"] += len(profiles) - len(eligible)
+            for profile in eligible:
+                if force:
+                    utils.drop_payload_hash(id_, profile)
+                items.append((id_, Topic.update, profile))
+
+        counters, _errors = aio.syndicate(items)
+        stats.counters.update(counters)
+        stats.packages += len(batch)
+        if on_progress:
+            for id_ in batch:
+                on_progress(id_)
+
+        batch = []
+        # do not keep ORM objects of the processed packages
+        model.Session.remove()
+
+    stats.finished = time.monotonic()
+    return stats
+
+
+def _sync_package(
+    package_id: str,
+    profiles: list[Profile],
+    limiters: dict[str, RateLimiter],
+    force: bool,
+) -> tuple[str, Counter[str]]:
+    counters: Counter[str] = Counter()
+
+    try:
+        items = []
+        for profile in profiles:
+            if force:
+                utils.drop_payload_hash(package_id, profile)
+            items.append((Topic.update, profile))
+
+        synced, _errors = tasks.sync_profiles(
+            package_id,
+            items,
+            throttle=lambda profile: limiters[profile.ckan_url].wait(),
+        )
+        counters.update(synced)
+    finally:
+        # every thread has its own session
+        model.Session.remove()
+
+    return package_id, counters
+
+
+def _with_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Make Flask context of the current thread available inside worker."""
+    if flask.has_request_context():
+        return flask.copy_current_request_context(func)
+
+    if flask.has_app_context():
+        app = flask.current_app._get_current_object()
+
+        def wrapper(*args: Any, **kwargs: Any):
+            with app.app_context():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return func
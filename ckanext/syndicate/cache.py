@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import ckan.plugins.toolkit as tk
+from ckan.exceptions import CkanConfigurationException
+from ckan.lib.redis import connect_to_redis
+
+from . import utils
+
+CONFIG_ORG_CACHE_BACKEND = "ckanext.syndicate.org_cache.backend"
+CONFIG_ORG_CACHE_TTL = "ckanext.syndicate.org_cache.ttl"
+CONFIG_ORG_CACHE_SIZE = "ckanext.syndicate.org_cache.size"
+
+# jobs are executed by forked processes, that do not share memory
+DEFAULT_ORG_CACHE_BACKEND = "redis"
+DEFAULT_ORG_CACHE_TTL = 60 * 60
+DEFAULT_ORG_CACHE_SIZE = 1024
+
+
+class Cache:
+    """Storage for string values, that expire after `ttl` seconds."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+
+class MemoryCache(Cache):
+    """In-process LRU cache.
+
+    Values are not shared between processes, so invalidation affects only
+    the current process.
+
+    """
+
+    def __init__(self, ttl: int, size: int):
+        super().__init__(ttl)
+        self.size = size
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache(Cache):
+    """Cache shared by all the processes, that use the same Redis."""
+
+    def __init__(self, ttl: int, namespace: str):
+        super().__init__(ttl)
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return utils.redis_key(self.namespace, key)
+
+    def get(self, key: str) -> Optional[str]:
+        value: Any = connect_to_redis().get(self._key(key))
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value
+
+    def set(self, key: str, value: str):
+        connect_to_redis().set(self._key(key), value, ex=self.ttl)
+
+    def delete(self, key: str):
+        connect_to_redis().delete(self._key(key))
+
+
+_org_cache: Optional[Cache] = None
+
+
+def get_org_cache() -> Cache:
+    """Cache of remote organization IDs."""
+    global _org_cache
+
+    if _org_cache is None:
+        _org_cache = _make_cache(
+            tk.config.get(CONFIG_ORG_CACHE_BACKEND, DEFAULT_ORG_CACHE_BACKEND),
+            tk.asint(
+                tk.config.get(CONFIG_ORG_CACHE_TTL, DEFAULT_ORG_CACHE_TTL)
+            ),
+            tk.asint(
+                tk.config.get(CONFIG_ORG_CACHE_SIZE, DEFAULT_ORG_CACHE_SIZE)
+            ),
+            "organization",
+        )
+    return _org_cache
+
+
+def reset_caches():
+    global _org_cache
+    _org_cache = None
+
+
+def _make_cache(backend: str, ttl: int, size: int, namespace: str) -> Cache:
+    if backend == "memory":
+        return MemoryCache(ttl, size)
+
+    if backend == "redis":
+        return RedisCache(ttl, namespace)
+
+    if backend == "none":
+        return Cache(ttl)
+
+    raise CkanConfigurationException(
+        f"Unsupported syndication cache backend: {backend}"
+    )
+
+
+def org_cache_key(profile_id: str, org_id: str) -> str:
+    # name of the organization can be changed, while ID remains the same
+    return f"{profile_id}:{org_id}"
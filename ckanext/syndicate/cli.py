@@ -2,12 +2,17 @@
 
 import logging
 import time
+from collections import Counter
 
 import ckan.model as model
 import ckan.plugins.toolkit as tk
 import click
 
+import ckanext.syndicate.bulk as bulk
+import ckanext.syndicate.outbox as outbox
+import ckanext.syndicate.reconcile as reconcile
 import ckanext.syndicate.utils as utils
+from ckanext.syndicate.types import Topic
 
 
 def get_commands():
@@ -21,33 +26,322 @@ def syndicate():
 
 @syndicate.command()
 @click.argument("id", required=False)
-@click.option("-t", "--timeout", type=float, default=0)
+@click.option(
+    "-t",
+    "--timeout",
+    type=float,
+    default=0,
+    help=(
+        "Delay between packages. In foreground mode, minimal interval"
+        " between syndications sent to the same remote portal"
+    ),
+)
 @click.option("-v", "--verbose", count=True)
-@click.option("-f", "--foreground", is_flag=True)
-def sync(id, timeout, verbose, foreground):
+@click.option(
+    "-f",
+    "--foreground",
+    is_flag=True,
+    help="Syndicate in the current process instead of enqueuing jobs",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of threads used in foreground mode",
+)
+@click.option("--chunk-size", type=int, default=1000)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Update remote datasets even if local datasets were not changed",
+)
+@click.option(
+    "--async",
+    "use_async",
+    is_flag=True,
+    help="Send requests concurrently using asyncio in foreground mode",
+)
+@click.option(
+    "-i",
+    "--incremental",
+    is_flag=True,
+    help=(
+        "Syndicate only flagged packages modified since their last"
+        " syndication to the profile"
+    ),
+)
+def sync(
+    id,
+    timeout,
+    verbose,
+    foreground,
+    workers,
+    chunk_size,
+    force,
+    use_async,
+    incremental,
+):
     """Syndicate datasets to remote portals."""
 
-    packages = model.Session.query(model.Package)
-    if id:
-        packages = packages.filter(
-            (model.Package.id == id) | (model.Package.name == id)
+    if not verbose:
+        logging.getLogger("ckanext.syndicate.plugin").propagate = False
+        logging.getLogger("ckan.lib.jobs").propagate = False
+
+    profiles = list(utils.get_syndicate_profiles())
+    if incremental:
+        # every profile has its own set of modified packages
+        batches = [
+            (bulk.changed_packages_query(profile), [profile])
+            for profile in profiles
+        ]
+    else:
+        batches = [(model.Session.query(model.Package.id), profiles)]
+
+    for packages, targets in batches:
+        if id:
+            packages = packages.filter(
+                (model.Package.id == id) | (model.Package.name == id)
+            )
+
+        if incremental:
+            click.echo(f"Profile {targets[0].id}:")
+
+        _sync(
+            packages,
+            targets,
+            timeout,
+            foreground,
+            workers,
+            chunk_size,
+            force,
+            use_async,
         )
 
+
+def _sync(
+    packages,
+    profiles,
+    timeout,
+    foreground,
+    workers,
+    chunk_size,
+    force,
+    use_async,
+):
     total = packages.count()
+    ids = bulk.iter_package_ids(packages, chunk_size)
 
-    if not verbose:
-        logging.getLogger("ckanext.syndicate.plugin").propagate = False
-        logging.getLogger("ckan.lib.jobs").propagate = False
+    if foreground and use_async:
+        with click.progressbar(length=total) as bar:
+            stats = bulk.sync_packages_async(
+                ids,
+                profiles,
+                batch_size=chunk_size,
+                on_progress=lambda _id: bar.update(1),
+                force=force,
+            )
+        click.secho(str(stats), fg="green")
+        return
+
+    if foreground:
+        with click.progressbar(length=total) as bar:
+            stats = bulk.sync_packages(
+                ids,
+                profiles,
+                workers,
+                timeout,
+                lambda _id: bar.update(1),
+                force,
+            )
+        click.secho(str(stats), fg="green")
+        return
+
+    eligible = bulk.iter_eligible(ids, profiles, chunk_size)
+    # keep interactive syndications ahead of mass resync
+    with click.progressbar(eligible, length=total) as bar, utils.bulk_lane():
+        for package_id, targets in bar:
+            if not targets:
+                continue
 
-    with click.progressbar(packages, length=total) as bar:
-        for package in bar:
             bar.label = "Sending syndication signal to package {}".format(
-                package.id
+                package_id
             )
-            utils.try_sync(package.id)
+            if force:
+                for profile in targets:
+                    utils.drop_payload_hash(package_id, profile)
+            utils.syndicate_package(package_id, Topic.update, targets)
             time.sleep(timeout)
 
 
+@syndicate.command("reconcile")
+@click.option(
+    "-p",
+    "--profile",
+    "profile_ids",
+    multiple=True,
+    help="Reconcile only the specified profiles",
+)
+@click.option("--page-size", type=int, default=reconcile.DEFAULT_PAGE_SIZE)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only report the drift, without enqueuing syndications",
+)
+@click.option("-v", "--verbose", is_flag=True, help="Report every change")
+def reconcile_command(profile_ids, page_size, dry_run, verbose):
+    """Syndicate only datasets that differ on local and remote portals.
+
+    Remote datasets, that are not tracked by any local dataset, are
+    reported, but never removed.
+    """
+    profiles = list(utils.get_syndicate_profiles())
+    if profile_ids:
+        profiles = [p for p in profiles if p.id in profile_ids]
+
+    for profile in profiles:
+        counters = Counter()
+        with utils.bulk_lane():
+            for change in reconcile.reconcile(profile, page_size):
+                counters[change.kind] += 1
+                if verbose or dry_run:
+                    click.echo(
+                        "{}: {} -> {}".format(
+                            change.kind,
+                            change.package_id or "-",
+                            change.remote_id or "-",
+                        )
+                    )
+
+                if not dry_run and change.kind != reconcile.ORPHAN:
+                    reconcile.apply(change, profile)
+
+        click.secho(
+            f"Profile {profile.id}: {counters[reconcile.CREATE]} to create,"
+            f" {counters[reconcile.UPDATE]} to update,"
+            f" {counters[reconcile.DELETE]} to delete,"
+            f" {counters[reconcile.ORPHAN]} orphaned",
+            fg="green",
+        )
+
+
+@syndicate.command()
+def resume():
+    """Enqueue syndications deferred because of unavailable remote portals.
+
+    Run it periodically, e.g. every minute via cron.
+    """
+    resumed = utils.resume_deferred()
+    click.secho(f"Resumed {resumed} deferred syndications", fg="green")
+
+
+@syndicate.command()
+@click.option("--batch-size", type=int, default=outbox.DEFAULT_BATCH_SIZE)
+@click.option(
+    "-l",
+    "--loop",
+    is_flag=True,
+    help="Keep dispatching syndications until interrupted",
+)
+@click.option(
+    "--interval",
+    type=float,
+    default=1,
+    help="Delay between checks of the empty outbox in loop mode",
+)
+def dispatch(batch_size, loop, interval):
+    """Move syndications from the outbox to the job queue.
+
+    Deferred syndications are resumed as well, so in loop mode it replaces
+    `ckan syndicate resume`.
+    """
+    while True:
+        try:
+            dispatched = outbox.dispatch(batch_size)
+            resumed = utils.resume_deferred()
+        except Exception as e:
+            if not loop:
+                raise
+            # failed transaction must not break the following iterations
+            model.Session.rollback()
+            tk.error_shout(f"Cannot dispatch syndications: {e}")
+            dispatched = resumed = 0
+
+        if not loop:
+            click.secho(
+                f"Dispatched {dispatched} syndications, resumed {resumed}"
+                " deferred syndications",
+                fg="green",
+            )
+            return
+
+        if dispatched < batch_size:
+            time.sleep(interval)
+
+
+@syndicate.group()
+def failures():
+    """Syndications that failed after all the retries."""
+
+
+def _failures_query(ids, profile, error):
+    package_ids = None
+    if ids:
+        package_ids = [
+            id_
+            for (id_,) in model.Session.query(model.Package.id).filter(
+                model.Package.id.in_(ids) | model.Package.name.in_(ids)
+            )
+        ]
+        # purged packages are identified only by ID
+        package_ids.extend(ids)
+    return utils.failed_syndications_query(package_ids, profile, error)
+
+
+@failures.command("list")
+@click.argument("ids", nargs=-1)
+@click.option("-p", "--profile", help="Show failures of the profile")
+@click.option("-e", "--error", help="Show failures with matching reason")
+@click.option("-l", "--limit", type=int, default=100)
+def list_failures(ids, profile, error, limit):
+    """List failed syndications, oldest first."""
+    query = _failures_query(ids, profile, error)
+    total = query.count()
+    for state in query.limit(limit):
+        click.echo(
+            "{} {} {} {} attempts={}: {}".format(
+                state.failed_at.isoformat(timespec="seconds"),
+                state.package_id,
+                state.profile_id,
+                state.deferred_topic,
+                state.attempts,
+                state.last_error,
+            )
+        )
+    click.secho(f"Total failures: {total}", fg="green")
+
+
+@failures.command("replay")
+@click.argument("ids", nargs=-1)
+@click.option("-p", "--profile", help="Replay failures of the profile")
+@click.option("-e", "--error", help="Replay failures with matching reason")
+@click.option(
+    "-a", "--all", "replay_all", is_flag=True, help="Replay all failures"
+)
+def replay_failures(ids, profile, error, replay_all):
+    """Enqueue failed syndications again.
+
+    Failures are selected by IDs or names of datasets, profile and part of
+    the failure reason.
+    """
+    if not (ids or profile or error or replay_all):
+        tk.error_shout("Specify failures to replay or use --all flag")
+        raise click.Abort()
+
+    replayed = utils.replay_failed(_failures_query(ids, profile, error))
+    click.secho(f"Replayed {replayed} failed syndications", fg="green")
+
+
 @syndicate.command()
 def init():
     """Creates new syndication table."""
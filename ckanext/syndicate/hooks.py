@@ -0,0 +1,128 @@
+"""Extension points, resolved once instead of on every syndication.
+
+Implementations of `ISyndicate` and legacy actions are looked up when the
+pipeline is used for the first time. The pipeline is dropped when plugins
+are (re)configured, so that it's resolved again with the current set of
+plugins.
+
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Callable, NamedTuple, Optional
+
+import ckan.plugins as plugins
+import ckan.plugins.toolkit as tk
+
+from .interfaces import ISyndicate
+from .types import Profile
+from .utils import deprecated
+
+log = logging.getLogger(__name__)
+
+
+class Pipeline(NamedTuple):
+    # the first implementation decides whether package is syndicated
+    skipper: ISyndicate
+    # skipper has no SQL equivalent of `skip_syndication`, so bulk
+    # operations must check packages one by one
+    check_each_package: bool
+    preparers: tuple[ISyndicate, ...]
+    update_dataset: Optional[Callable[..., Any]]
+    before_action: Optional[Callable[..., Any]]
+    after_action: Optional[Callable[..., Any]]
+
+    def prepare(
+        self, package_id: str, package: dict[str, Any], profile: Profile
+    ) -> dict[str, Any]:
+        if self.update_dataset:
+            package = self.update_dataset(
+                {}, {"dataset_dict": package, "package_id": package_id}
+            )
+        for plugin in self.preparers:
+            package = plugin.prepare_package_for_syndication(
+                package_id, package, profile
+            )
+        return package
+
+
+_pipeline: Optional[Pipeline] = None
+
+
+def get_pipeline() -> Pipeline:
+    global _pipeline
+
+    if _pipeline is None:
+        _pipeline = _build()
+    return _pipeline
+
+
+def reset():
+    global _pipeline
+    _pipeline = None
+
+
+def _build() -> Pipeline:
+    implementations = tuple(plugins.PluginImplementations(ISyndicate))
+    skipper = implementations[0]
+    check_each_package = (
+        type(skipper).skip_syndication is not ISyndicate.skip_syndication
+        and type(skipper).filter_syndicated_packages
+        is ISyndicate.filter_syndicated_packages
+    )
+    if check_each_package:
+        log.warning(
+            "%s overrides skip_syndication, but not"
+            " filter_syndicated_packages. Bulk operations call"
+            " skip_syndication for every package",
+            skipper.name,
+        )
+
+    # default implementation returns package unchanged
+    preparers = tuple(
+        plugin
+        for plugin in implementations
+        if type(plugin).prepare_package_for_syndication
+        is not ISyndicate.prepare_package_for_syndication
+    )
+
+    update_dataset = _get_action("update_dataset_for_syndication")
+    if update_dataset:
+        deprecated(
+            "update_dataset_for_syndication is deprecated. Implement"
+            " ISyndicate instead"
+        )
+
+    before_action = _get_action("before_syndication_action")
+    if before_action:
+        deprecated(
+            "before_syndication_action is deprecated. Use before_syndication"
+            " signal instead"
+        )
+
+    after_action = _get_action("after_syndication_action")
+    if after_action:
+        deprecated(
+            "after_syndication_action is deprecated. Use after_syndication"
+            " signal instead"
+        )
+
+    log.debug(
+        "Syndication pipeline: %s",
+        ", ".join(plugin.name for plugin in implementations),
+    )
+    return Pipeline(
+        skipper,
+        check_each_package,
+        preparers,
+        update_dataset,
+        before_action,
+        after_action,
+    )
+
+
+def _get_action(name: str) -> Optional[Callable[..., Any]]:
+    try:
+        return tk.get_action(name)
+    except KeyError:
+        return None
@@ -0,0 +1,169 @@
+"""Images of organizations, replicated to remote portals.
+
+Images are never downloaded during syndication of the package. Remote
+organization is created without image and the image is sent by the
+separate background job.
+
+Uploaded images are read directly from the local storage. External images
+are downloaded once and cached on disk. Cached file is named after the hash
+of its content, so the image used by multiple organizations is stored only
+once.
+
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+import ckan.plugins.toolkit as tk
+import requests
+from ckan.lib import uploader
+
+CONFIG_CACHE_DIR = "ckanext.syndicate.image_cache.directory"
+CONFIG_CACHE_TTL = "ckanext.syndicate.image_cache.ttl"
+CONFIG_FETCH_TIMEOUT = "ckanext.syndicate.image_cache.timeout"
+CONFIG_MAX_SIZE = "ckanext.syndicate.image_cache.max_size"
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+DEFAULT_FETCH_TIMEOUT = 10
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+
+def has_image(org: dict[str, Any]) -> bool:
+    return bool(org.get("image_url") or org.get("image_display_url"))
+
+
+def get_cache_dir() -> str:
+    path = tk.config.get(CONFIG_CACHE_DIR)
+    if not path:
+        storage = tk.config.get("ckan.storage_path")
+        if storage:
+            path = os.path.join(storage, "syndicate", "images")
+        else:
+            path = os.path.join(tempfile.gettempdir(), "ckanext-syndicate")
+
+    os.makedirs(os.path.join(path, "urls"), exist_ok=True)
+    return path
+
+
+def get_image(org: dict[str, Any]) -> Optional[tuple[str, str]]:
+    """Path to the image of the organization and its filename.
+
+    `None` means that organization has no image or it cannot be
+    downloaded.
+
+    """
+    image_url = org.get("image_url") or ""
+    path = local_path(image_url)
+    if path:
+        return path, os.path.basename(path)
+
+    url = org.get("image_display_url") or image_url
+    if not url.startswith(("http://", "https://")):
+        return None
+
+    path = fetch(url)
+    if not path:
+        return None
+
+    filename = os.path.basename(urlparse(url).path) or os.path.basename(path)
+    return path, filename
+
+
+def local_path(image_url: str) -> Optional[str]:
+    """Path to the image, uploaded to the local portal."""
+    if not image_url or image_url.startswith(("http://", "https://")):
+        return None
+
+    upload = uploader.get_uploader("group")
+    storage = getattr(upload, "storage_path", None)
+    if not storage:
+        # non-filesystem storage
+        return None
+
+    # image_url of uploaded image contains only the name of the file
+    path = os.path.join(storage, os.path.basename(image_url))
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def fetch(url: str) -> Optional[str]:
+    """Download the image, unless it's already cached."""
+    directory = get_cache_dir()
+    ref = os.path.join(directory, "urls", _hash(url.encode()))
+
+    path = _read_ref(directory, ref)
+    if path:
+        return path
+
+    timeout = float(tk.config.get(CONFIG_FETCH_TIMEOUT, DEFAULT_FETCH_TIMEOUT))
+    max_size = tk.asint(tk.config.get(CONFIG_MAX_SIZE, DEFAULT_MAX_SIZE))
+
+    log.debug("Download image %s", url)
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dest, requests.get(
+            url, stream=True, timeout=timeout
+        ) as resp:
+            resp.raise_for_status()
+            size = 0
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    log.warning(
+                        "Image %s is bigger than %d bytes", url, max_size
+                    )
+                    return None
+                digest.update(chunk)
+                dest.write(chunk)
+
+        path = os.path.join(directory, digest.hexdigest())
+        os.replace(tmp, path)
+    except requests.RequestException as e:
+        log.warning("Cannot download image %s: %s", url, e)
+        return None
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    _write_ref(ref, digest.hexdigest())
+    return path
+
+
+def _read_ref(directory: str, ref: str) -> Optional[str]:
+    """Path to the cached image, referenced by the URL."""
+    ttl = tk.asint(tk.config.get(CONFIG_CACHE_TTL, DEFAULT_CACHE_TTL))
+    try:
+        # image behind the URL can be changed
+        if os.path.getmtime(ref) + ttl < time.time():
+            return None
+        with open(ref) as src:
+            path = os.path.join(directory, src.read().strip())
+    except OSError:
+        return None
+
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def _write_ref(ref: str, content_hash: str):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ref), suffix=".tmp")
+    with os.fdopen(fd, "w") as dest:
+        dest.write(content_hash)
+    os.replace(tmp, ref)
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
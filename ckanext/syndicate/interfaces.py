@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import logging
 from typing import Any
-from werkzeug.utils import import_string
 
 import ckan.model as model
 import ckan.plugins.toolkit as tk
+import sqlalchemy as sa
 from ckan.plugins import Interface
 
+from . import utils
 from .types import Profile
 
+# values accepted by `tk.asbool`
+TRUE_VALUES = ("true", "yes", "on", "y", "t", "1")
+
 log = logging.getLogger(__name__)
 
 
@@ -28,8 +32,8 @@ class ISyndicate(Interface):
         if package.private:
             return True
 
-        if profile.predicate:
-            predicate = import_string(profile.predicate)
+        predicate = utils.get_predicate(profile)
+        if predicate:
             if not predicate(package):
                 log.info(
                     "Dataset[{}] will not syndicate because of predicate[{}]"
@@ -40,6 +44,24 @@ class ISyndicate(Interface):
         syndicate = tk.asbool(package.extras.get(profile.flag, "false"))
         return not syndicate
 
+    def filter_syndicated_packages(self, query: Any, profile: Profile) -> Any:
+        """Set-based equivalent of `skip_syndication` for bulk operations.
+
+        Receives the query of package IDs and returns it with the filters
+        that keep only packages syndicated to the profile. Predicate of the
+        profile is applied separately, as it's not expressed in SQL.
+
+        """
+        flag = sa.and_(
+            model.PackageExtra.package_id == model.Package.id,
+            model.PackageExtra.key == profile.flag,
+            model.PackageExtra.state == model.State.ACTIVE,
+            sa.func.lower(model.PackageExtra.value).in_(TRUE_VALUES),
+        )
+        return query.join(model.PackageExtra, flag).filter(
+            model.Package.private == sa.false()
+        )
+
     def prepare_package_for_syndication(
         self, package_id: str, data_dict: dict[str, Any], profile: Profile
     ) -> dict[str, Any]:
@@ -0,0 +1,205 @@
+"""Protection of remote portals and workers from each other.
+
+State is kept in Redis, so that all the workers share the same limits for
+the remote portal:
+
+* token bucket limits the number of requests per second sent to the
+  remote portal;
+* circuit breaker stops sending requests to the remote portal after
+  consecutive failures. When cooldown period is over, single probe request
+  is allowed. If it succeeds, the circuit is closed again.
+
+When remote portal cannot be used, `RemoteUnavailable` is raised and
+syndication is deferred instead of blocking the worker.
+
+"""
+from __future__ import annotations
+
+import logging
+import time
+
+import ckan.plugins.toolkit as tk
+import ckanapi
+import requests
+from ckan.lib.redis import connect_to_redis
+
+from . import metrics, utils
+
+CONFIG_RATE = "ckanext.syndicate.remote.rate"
+CONFIG_BURST = "ckanext.syndicate.remote.burst"
+CONFIG_MAX_WAIT = "ckanext.syndicate.remote.max_wait"
+CONFIG_FAILURE_THRESHOLD = "ckanext.syndicate.breaker.threshold"
+CONFIG_COOLDOWN = "ckanext.syndicate.breaker.cooldown"
+
+DEFAULT_RATE = 0
+DEFAULT_MAX_WAIT = 10
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 60
+
+log = logging.getLogger(__name__)
+
+# refill the bucket and take one token, if possible. Returns number of
+# seconds before token becomes available(as a string, to keep
+# fractions). Current time is passed by client, because scripts cannot
+# write after TIME call in old versions of Redis.
+_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(redis.call("hget", KEYS[1], "tokens"))
+local ts = tonumber(redis.call("hget", KEYS[1], "ts"))
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("hmset", KEYS[1], "tokens", tostring(tokens), "ts", ARGV[3])
+redis.call("expire", KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RemoteUnavailable(Exception):
+    """Remote portal cannot accept requests at the moment."""
+
+    def __init__(self, url: str, retry_after: float, reason: str):
+        super().__init__(f"{url} is unavailable: {reason}")
+        self.url = url
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _key(kind: str, url: str) -> str:
+    return utils.redis_key(kind, url.rstrip("/"))
+
+
+def get_rate() -> float:
+    return float(tk.config.get(CONFIG_RATE, DEFAULT_RATE))
+
+
+def get_cooldown() -> float:
+    return float(tk.config.get(CONFIG_COOLDOWN, DEFAULT_COOLDOWN))
+
+
+def reserve(url: str) -> float:
+    """Take a token for the request.
+
+    Returns 0 if token is taken or number of seconds to wait otherwise.
+
+    """
+    rate = get_rate()
+    if rate <= 0:
+        return 0
+
+    burst = float(tk.config.get(CONFIG_BURST, max(rate, 1)))
+    conn = connect_to_redis()
+    wait = conn.eval(
+        _TOKEN_BUCKET, 1, _key("bucket", url), rate, burst, repr(time.time())
+    )
+    return float(wait)
+
+
+def check_circuit(url: str) -> bool:
+    """Raise RemoteUnavailable if the circuit of the remote is open.
+
+    Returns `True` if failures of the remote are recorded, so that
+    successful request must reset them with `record_success`.
+
+    """
+    threshold = tk.asint(
+        tk.config.get(CONFIG_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD)
+    )
+    if threshold <= 0:
+        return False
+
+    conn = connect_to_redis()
+    open_until, failures = conn.hmget(
+        _key("breaker", url), "open_until", "failures"
+    )
+    if open_until is None:
+        return failures is not None
+
+    now = time.time()
+    remains = float(open_until) - now
+    if remains > 0:
+        raise RemoteUnavailable(url, remains, "circuit is open")
+
+    # half-open: only one worker probes the remote
+    cooldown = get_cooldown()
+    if not conn.set(_key("probe", url), 1, nx=True, ex=int(cooldown) or 1):
+        raise RemoteUnavailable(url, cooldown, "remote is probed")
+    return True
+
+
+def acquire(url: str) -> bool:
+    """Wait until request can be sent to the remote portal.
+
+    Returns the result of `check_circuit`.
+
+    """
+    failing = check_circuit(url)
+
+    max_wait = float(tk.config.get(CONFIG_MAX_WAIT, DEFAULT_MAX_WAIT))
+    waited = 0.0
+    while True:
+        wait = reserve(url)
+        if not wait:
+            return failing
+
+        if waited + wait > max_wait:
+            raise RemoteUnavailable(url, wait, "rate limit exceeded")
+
+        time.sleep(wait)
+        waited += wait
+
+
+def record_success(url: str):
+    conn = connect_to_redis()
+    conn.delete(_key("breaker", url), _key("probe", url))
+
+
+def record_failure(url: str):
+    threshold = tk.asint(
+        tk.config.get(CONFIG_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD)
+    )
+    if threshold <= 0:
+        return
+
+    cooldown = get_cooldown()
+    key = _key("breaker", url)
+    conn = connect_to_redis()
+
+    failures = conn.hincrby(key, "failures", 1)
+    conn.expire(key, int(cooldown * 10) or 1)
+    if failures < threshold:
+        return
+
+    log.warning(
+        "Remote portal %s failed %d times in a row. Pause syndication for"
+        " %s seconds",
+        url,
+        failures,
+        cooldown,
+    )
+    metrics.incr("circuit_opened", remote=url)
+    conn.hset(key, "open_until", repr(time.time() + cooldown))
+    conn.delete(_key("probe", url))
+
+
+def is_failure(error: Exception) -> bool:
+    """Check if error means that remote portal is not healthy."""
+    if isinstance(error, requests.RequestException):
+        return True
+
+    if isinstance(error, ckanapi.ServerIncompatibleError):
+        return True
+
+    # 5xx responses. Other errors are subclasses, reported by the healthy
+    # portal
+    return type(error) is ckanapi.CKANAPIError
@@ -0,0 +1,251 @@
+"""Instrumentation of the syndication process.
+
+Metrics are sent to the exporter, configured by
+`ckanext.syndicate.metrics.exporter` option:
+
+* none - metrics are not collected
+* statsd - metrics are sent to StatsD server over UDP
+* prometheus - metrics are accumulated in Redis(so that all the workers
+  share them) and written into the file in Prometheus text format. Use it
+  with textfile collector of node_exporter.
+
+"""
+from __future__ import annotations
+
+import calendar
+import contextlib
+import functools
+import logging
+import os
+import re
+import socket
+import tempfile
+import time
+from typing import Any, Callable, Optional
+
+import ckan.plugins.toolkit as tk
+from ckan.exceptions import CkanConfigurationException
+from ckan.lib.redis import connect_to_redis
+
+from . import signals, utils
+
+CONFIG_EXPORTER = "ckanext.syndicate.metrics.exporter"
+CONFIG_PREFIX = "ckanext.syndicate.metrics.prefix"
+CONFIG_STATSD_HOST = "ckanext.syndicate.metrics.statsd_host"
+CONFIG_STATSD_PORT = "ckanext.syndicate.metrics.statsd_port"
+CONFIG_TEXTFILE = "ckanext.syndicate.metrics.textfile"
+
+DEFAULT_PREFIX = "ckanext_syndicate"
+
+log = logging.getLogger(__name__)
+
+
+class Exporter:
+    """Exporter that ignores all the metrics."""
+
+    def incr(self, name: str, value: float, tags: dict[str, str]):
+        pass
+
+    def timing(self, name: str, seconds: float, tags: dict[str, str]):
+        pass
+
+    def flush(self):
+        pass
+
+
+class StatsdExporter(Exporter):
+    def __init__(self, host: str, port: int, prefix: str):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name: str, tags: dict[str, str]) -> str:
+        parts = [self.prefix, name] + [_sanitize(v) for v in tags.values()]
+        return ".".join(parts)
+
+    def _send(self, data: str):
+        try:
+            self.socket.sendto(data.encode(), self.address)
+        except OSError as e:
+            log.debug("Cannot send metrics to StatsD: %s", e)
+
+    def incr(self, name: str, value: float, tags: dict[str, str]):
+        self._send(f"{self._name(name, tags)}:{value}|c")
+
+    def timing(self, name: str, seconds: float, tags: dict[str, str]):
+        self._send(f"{self._name(name, tags)}:{seconds * 1000:.3f}|ms")
+
+
+class PrometheusExporter(Exporter):
+    def __init__(self, path: str, prefix: str):
+        self.path = path
+        self.prefix = prefix
+        self.key = utils.redis_key("metrics")
+
+    def _field(self, name: str, tags: dict[str, str]) -> str:
+        labels = ",".join(
+            '{}="{}"'.format(k, str(v).replace('"', '\\"'))
+            for k, v in sorted(tags.items())
+        )
+        return f"{self.prefix}_{name}{{{labels}}}"
+
+    def incr(self, name: str, value: float, tags: dict[str, str]):
+        connect_to_redis().hincrbyfloat(
+            self.key, self._field(name + "_total", tags), value
+        )
+
+    def timing(self, name: str, seconds: float, tags: dict[str, str]):
+        with connect_to_redis().pipeline() as pipe:
+            pipe.hincrbyfloat(
+                self.key, self._field(name + "_seconds_sum", tags), seconds
+            )
+            pipe.hincrbyfloat(
+                self.key, self._field(name + "_seconds_count", tags), 1
+            )
+            pipe.execute()
+
+    def flush(self):
+        values = connect_to_redis().hgetall(self.key)
+        lines = sorted(
+            "{} {}".format(
+                k.decode() if isinstance(k, bytes) else k,
+                float(v),
+            )
+            for k, v in values.items()
+        )
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # textfile collector must never see partially written file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as dest:
+            dest.write("\n".join(lines) + "\n")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, self.path)
+
+
+_exporter: Optional[Exporter] = None
+
+
+def get_exporter() -> Exporter:
+    global _exporter
+
+    if _exporter is None:
+        _exporter = _make_exporter()
+    return _exporter
+
+
+def reset():
+    global _exporter
+    _exporter = None
+
+
+def _make_exporter() -> Exporter:
+    kind = tk.config.get(CONFIG_EXPORTER, "none")
+    prefix = tk.config.get(CONFIG_PREFIX, DEFAULT_PREFIX)
+
+    if kind == "none":
+        return Exporter()
+
+    if kind == "statsd":
+        return StatsdExporter(
+            tk.config.get(CONFIG_STATSD_HOST, "localhost"),
+            tk.asint(tk.config.get(CONFIG_STATSD_PORT, 8125)),
+            prefix,
+        )
+
+    if kind == "prometheus":
+        path = tk.config.get(CONFIG_TEXTFILE)
+        if not path:
+            raise CkanConfigurationException(
+                f"{CONFIG_TEXTFILE} is required by prometheus exporter"
+            )
+        return PrometheusExporter(path, prefix)
+
+    raise CkanConfigurationException(
+        f"Unsupported syndication metrics exporter: {kind}"
+    )
+
+
+def incr(name: str, value: float = 1, **tags: str):
+    get_exporter().incr(name, value, tags)
+
+
+def timing(name: str, seconds: float, **tags: str):
+    get_exporter().timing(name, seconds, tags)
+
+
+def flush():
+    try:
+        get_exporter().flush()
+    except Exception:
+        log.exception("Cannot flush syndication metrics")
+
+
+@contextlib.contextmanager
+def timer(name: str, **tags: str):
+    """Measure duration of the block and count errors by exception type."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        incr(name + "_errors", error=type(e).__name__, **tags)
+        raise
+    finally:
+        timing(name, time.perf_counter() - start, **tags)
+
+
+def job(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Instrument background job.
+
+    Records time spent by job in the queue, duration of job and flushes
+    collected metrics when job is finished.
+
+    """
+
+    def decorator(func: Callable[..., Any]):
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any):
+            _record_queue_lag(name)
+            try:
+                with timer("job", job=name):
+                    return func(*args, **kwargs)
+            finally:
+                flush()
+
+        return wrapper
+
+    return decorator
+
+
+def _record_queue_lag(name: str):
+    try:
+        from rq import get_current_job
+    except ImportError:
+        return
+
+    current = get_current_job()
+    if not current or not current.enqueued_at:
+        return
+
+    # RQ stores naive UTC datetimes
+    lag = time.time() - _timestamp(current.enqueued_at)
+    timing("queue_lag", max(lag, 0), job=name)
+
+
+def _timestamp(value: Any) -> float:
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _sanitize(value: Any) -> str:
+    return re.sub(r"[^\w-]", "_", str(value))
+
+
+def _on_after_syndication(package_id: str, **kwargs: Any):
+    profile = kwargs.get("profile")
+    incr("syndicated", profile=profile.id if profile else "")
+
+
+def setup():
+    """Reset exporter and subscribe to syndication signals."""
+    reset()
+    signals.after_syndication.connect(_on_after_syndication)
@@ -0,0 +1,37 @@
+"""Add deferred syndication
+
+Revision ID: 3b9e4a7c5d21
+Revises: 8d1c1b6e2f4a
+Create Date: 2026-10-18 14:02:47.118305
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b9e4a7c5d21"
+down_revision = "8d1c1b6e2f4a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "syndicate_sync_state", sa.Column("deferred_topic", sa.UnicodeText)
+    )
+    op.add_column(
+        "syndicate_sync_state", sa.Column("next_attempt_at", sa.DateTime)
+    )
+    op.create_index(
+        "idx_syndicate_sync_state_deferred",
+        "syndicate_sync_state",
+        ["next_attempt_at"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "idx_syndicate_sync_state_deferred", table_name="syndicate_sync_state"
+    )
+    op.drop_column("syndicate_sync_state", "next_attempt_at")
+    op.drop_column("syndicate_sync_state", "deferred_topic")
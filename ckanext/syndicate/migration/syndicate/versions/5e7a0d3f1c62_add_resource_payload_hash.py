@@ -0,0 +1,26 @@
+"""Add resource payload hash
+
+Revision ID: 5e7a0d3f1c62
+Revises: c41f6e2a9b83
+Create Date: 2026-10-18 17:25:44.930127
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e7a0d3f1c62"
+down_revision = "c41f6e2a9b83"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "syndicate_resource_state",
+        sa.Column("payload_hash", sa.UnicodeText),
+    )
+
+
+def downgrade():
+    op.drop_column("syndicate_resource_state", "payload_hash")
@@ -0,0 +1,25 @@
+"""Add remote modification time
+
+Revision ID: 7c3d9b2a6e48
+Revises: d84b5e1f7a30
+Create Date: 2026-10-18 22:14:51.406128
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c3d9b2a6e48"
+down_revision = "d84b5e1f7a30"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "syndicate_sync_state", sa.Column("remote_modified", sa.DateTime)
+    )
+
+
+def downgrade():
+    op.drop_column("syndicate_sync_state", "remote_modified")
@@ -0,0 +1,42 @@
+"""Add sync state table
+
+Revision ID: 8d1c1b6e2f4a
+Revises: f2304c5669f5
+Create Date: 2026-10-18 10:12:31.417254
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8d1c1b6e2f4a"
+down_revision = "f2304c5669f5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "syndicate_sync_state",
+        sa.Column("package_id", sa.UnicodeText, primary_key=True),
+        sa.Column("profile_id", sa.UnicodeText, primary_key=True),
+        sa.Column("remote_id", sa.UnicodeText),
+        sa.Column("remote_name", sa.UnicodeText),
+        sa.Column("last_synced_at", sa.DateTime),
+        sa.Column("payload_hash", sa.UnicodeText),
+        sa.Column("status", sa.UnicodeText, nullable=False),
+    )
+    op.create_index(
+        "idx_syndicate_sync_state_remote",
+        "syndicate_sync_state",
+        ["profile_id", "remote_id"],
+    )
+    op.create_index(
+        "idx_syndicate_sync_state_status",
+        "syndicate_sync_state",
+        ["profile_id", "status"],
+    )
+
+
+def downgrade():
+    op.drop_table("syndicate_sync_state")
@@ -0,0 +1,30 @@
+"""Add outbox table
+
+Revision ID: 9a6f2c8e4b17
+Revises: 5e7a0d3f1c62
+Create Date: 2026-10-18 19:12:31.482790
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9a6f2c8e4b17"
+down_revision = "5e7a0d3f1c62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "syndicate_outbox",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("package_id", sa.UnicodeText, nullable=False),
+        sa.Column("topic", sa.UnicodeText, nullable=False),
+        sa.Column("profiles", sa.UnicodeText, nullable=False),
+        sa.Column("created_at", sa.DateTime, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("syndicate_outbox")
@@ -0,0 +1,39 @@
+"""Add resource state table
+
+Revision ID: c41f6e2a9b83
+Revises: 3b9e4a7c5d21
+Create Date: 2026-10-18 16:40:05.602913
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c41f6e2a9b83"
+down_revision = "3b9e4a7c5d21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "syndicate_resource_state",
+        sa.Column("resource_id", sa.UnicodeText, primary_key=True),
+        sa.Column("profile_id", sa.UnicodeText, primary_key=True),
+        sa.Column("package_id", sa.UnicodeText, nullable=False),
+        sa.Column("remote_id", sa.UnicodeText),
+        sa.Column("remote_url", sa.UnicodeText),
+        sa.Column("size", sa.BigInteger),
+        sa.Column("mtime", sa.Float),
+        sa.Column("file_hash", sa.UnicodeText),
+        sa.Column("last_synced_at", sa.DateTime),
+    )
+    op.create_index(
+        "idx_syndicate_resource_state_package",
+        "syndicate_resource_state",
+        ["profile_id", "package_id"],
+    )
+
+
+def downgrade():
+    op.drop_table("syndicate_resource_state")
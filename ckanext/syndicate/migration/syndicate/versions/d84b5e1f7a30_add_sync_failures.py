@@ -0,0 +1,40 @@
+"""Add sync failures
+
+Revision ID: d84b5e1f7a30
+Revises: 9a6f2c8e4b17
+Create Date: 2026-10-18 20:37:09.215664
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d84b5e1f7a30"
+down_revision = "9a6f2c8e4b17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "syndicate_sync_state",
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "syndicate_sync_state", sa.Column("last_error", sa.UnicodeText)
+    )
+    op.add_column("syndicate_sync_state", sa.Column("failed_at", sa.DateTime))
+    op.create_index(
+        "idx_syndicate_sync_state_failed",
+        "syndicate_sync_state",
+        ["failed_at"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "idx_syndicate_sync_state_failed", table_name="syndicate_sync_state"
+    )
+    op.drop_column("syndicate_sync_state", "failed_at")
+    op.drop_column("syndicate_sync_state", "last_error")
+    op.drop_column("syndicate_sync_state", "attempts")
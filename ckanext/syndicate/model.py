@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+import ckan.model as model
+from ckan.model.meta import metadata
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    UnicodeText,
+)
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base(metadata=metadata)
+
+STATUS_SYNCED = "synced"
+STATUS_DELETED = "deleted"
+
+
+class SyncState(Base):
+    """Result of the package syndication for the particular profile."""
+
+    __tablename__ = "syndicate_sync_state"
+    __table_args__ = (
+        Index("idx_syndicate_sync_state_remote", "profile_id", "remote_id"),
+        Index("idx_syndicate_sync_state_status", "profile_id", "status"),
+        Index("idx_syndicate_sync_state_deferred", "next_attempt_at"),
+        Index("idx_syndicate_sync_state_failed", "failed_at"),
+    )
+
+    package_id = Column(UnicodeText, primary_key=True)
+    profile_id = Column(UnicodeText, primary_key=True)
+    remote_id = Column(UnicodeText)
+    remote_name = Column(UnicodeText)
+    last_synced_at = Column(DateTime)
+    # metadata_modified of the remote package, as reported by remote portal
+    remote_modified = Column(DateTime)
+    payload_hash = Column(UnicodeText)
+    status = Column(UnicodeText, nullable=False, default=STATUS_SYNCED)
+    # syndication postponed because remote portal is unavailable
+    deferred_topic = Column(UnicodeText)
+    next_attempt_at = Column(DateTime)
+    # consecutive failures of syndication
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(UnicodeText)
+    # retries are exhausted and syndication waits for manual replay
+    failed_at = Column(DateTime)
+
+    @classmethod
+    def get(cls, package_id: str, profile_id: str) -> Optional[SyncState]:
+        return model.Session.query(cls).get((package_id, profile_id))
+
+    @classmethod
+    def get_or_create(cls, package_id: str, profile_id: str) -> SyncState:
+        state = cls.get(package_id, profile_id)
+        if not state:
+            state = cls(package_id=package_id, profile_id=profile_id)
+            model.Session.add(state)
+        return state
+
+    def touch(self, status: str = STATUS_SYNCED):
+        self.status = status
+        self.last_synced_at = datetime.datetime.utcnow()
+        self.deferred_topic = None
+        self.next_attempt_at = None
+        self.attempts = 0
+        self.last_error = None
+        self.failed_at = None
+
+    def defer(self, topic: str, delay: float):
+        self.deferred_topic = topic
+        self.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=delay
+        )
+
+    def fail(self, topic: str, error: str):
+        """Move syndication to the dead-letter store."""
+        self.deferred_topic = topic
+        self.next_attempt_at = None
+        self.last_error = error
+        self.failed_at = datetime.datetime.utcnow()
+
+
+class ResourceState(Base):
+    """Remote copy of the local resource for the particular profile."""
+
+    __tablename__ = "syndicate_resource_state"
+    __table_args__ = (
+        Index(
+            "idx_syndicate_resource_state_package", "profile_id", "package_id"
+        ),
+    )
+
+    resource_id = Column(UnicodeText, primary_key=True)
+    profile_id = Column(UnicodeText, primary_key=True)
+    package_id = Column(UnicodeText, nullable=False)
+    remote_id = Column(UnicodeText)
+    remote_url = Column(UnicodeText)
+    size = Column(BigInteger)
+    mtime = Column(Float)
+    file_hash = Column(UnicodeText)
+    payload_hash = Column(UnicodeText)
+    last_synced_at = Column(DateTime)
+
+    @classmethod
+    def for_package(
+        cls, package_id: str, profile_id: str
+    ) -> dict[str, ResourceState]:
+        """Remote resources of the package, by ID of the local resource."""
+        states = model.Session.query(cls).filter(
+            cls.package_id == package_id, cls.profile_id == profile_id
+        )
+        return {state.resource_id: state for state in states}
+
+    def touch(self):
+        self.last_synced_at = datetime.datetime.utcnow()
+
+
+class OutboxEntry(Base):
+    """Syndication recorded in the transaction that modified the package.
+
+    Entries are moved to the job queue by `ckan syndicate dispatch`.
+
+    """
+
+    __tablename__ = "syndicate_outbox"
+
+    id = Column(Integer, primary_key=True)
+    package_id = Column(UnicodeText, nullable=False)
+    topic = Column(UnicodeText, nullable=False)
+    # space-separated IDs of profiles
+    profiles = Column(UnicodeText, nullable=False)
+    created_at = Column(
+        DateTime, nullable=False, default=datetime.datetime.utcnow
+    )
@@ -0,0 +1,112 @@
+"""Transactional outbox of syndication events.
+
+When outbox is enabled, notification does not touch the job queue. The
+syndication is recorded as a row in the same DB transaction that modified
+the package, so request latency does not depend on Redis and the event is
+not lost when queue is unavailable. Rows are moved to the queue in batches
+by the dispatcher(`ckan syndicate dispatch`). Entry is removed only after
+its job is enqueued.
+
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+from collections import defaultdict
+from typing import Iterable
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from . import metrics, utils
+from .model import OutboxEntry
+from .types import Profile, Topic
+
+CONFIG_ENABLED = "ckanext.syndicate.outbox.enabled"
+
+DEFAULT_BATCH_SIZE = 500
+
+log = logging.getLogger(__name__)
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_ENABLED, False))
+
+
+def add(package_id: str, topic: Topic, profiles: Iterable[Profile]):
+    """Record syndication in the current transaction.
+
+    Entry is committed together with the modification of the package.
+
+    """
+    model.Session.add(
+        OutboxEntry(
+            package_id=package_id,
+            topic=topic.name,
+            profiles=" ".join(profile.id for profile in profiles),
+        )
+    )
+
+
+def dispatch(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Enqueue the oldest syndications from the outbox.
+
+    Multiple entries of the same package are merged into a single
+    syndication. Entries locked by another dispatcher are skipped. Returns
+    the number of dispatched entries.
+
+    """
+    entries = (
+        model.Session.query(OutboxEntry)
+        .order_by(OutboxEntry.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not entries:
+        model.Session.rollback()
+        return 0
+
+    now = datetime.datetime.utcnow()
+    topics: dict[tuple[str, str], Topic] = {}
+    for entry in entries:
+        metrics.timing("outbox_lag", (now - entry.created_at).total_seconds())
+        for profile_id in entry.profiles.split():
+            key = (entry.package_id, profile_id)
+            topic = Topic[entry.topic]
+            if key in topics:
+                topic = utils.merge_topics(topics[key], topic)
+            topics[key] = topic
+
+    groups: defaultdict[tuple[str, Topic], list[Profile]] = defaultdict(list)
+    for (package_id, profile_id), topic in topics.items():
+        profile = utils.get_profile(profile_id)
+        if not profile:
+            log.warning(
+                "Profile %s does not exist anymore. Drop syndication of %s",
+                profile_id,
+                package_id,
+            )
+            continue
+        groups[(package_id, topic)].append(profile)
+
+    try:
+        for (package_id, topic), profiles in groups.items():
+            utils.syndicate_package(package_id, topic, profiles)
+    except Exception:
+        # entries stay in the outbox until queue is available
+        model.Session.rollback()
+        raise
+
+    model.Session.query(OutboxEntry).filter(
+        OutboxEntry.id.in_([entry.id for entry in entries])
+    ).delete(synchronize_session=False)
+    model.Session.commit()
+
+    metrics.incr("outbox_dispatched", len(entries))
+    return len(entries)
+
+
+def count() -> int:
+    """Number of syndications waiting in the outbox."""
+    return model.Session.query(OutboxEntry).count()
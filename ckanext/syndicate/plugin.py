@@ -8,7 +8,11 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as tk
 from ckan.model.domain_object import DomainObjectOperation
 
+import ckanext.syndicate.cache as cache
 import ckanext.syndicate.cli as cli
+import ckanext.syndicate.hooks as hooks
+import ckanext.syndicate.metrics as metrics
+import ckanext.syndicate.outbox as outbox
 import ckanext.syndicate.utils as utils
 
 from .interfaces import ISyndicate
@@ -25,6 +29,7 @@ class SyndicatePlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IDomainObjectModification, inherit=True)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.IConfigurable)
+    plugins.implements(plugins.IOrganizationController, inherit=True)
     plugins.implements(ISyndicate, inherit=True)
 
     # IConfigurable
@@ -34,12 +39,25 @@ class SyndicatePlugin(plugins.SingletonPlugin):
             warnings.filterwarnings(
                 "default", category=utils.SyndicationDeprecationWarning
             )
+        utils.reload_profiles(config)
+        cache.reset_caches()
+        metrics.setup()
+        # set of plugins may be changed
+        hooks.reset()
 
     # IClick
 
     def get_commands(self):
         return cli.get_commands()
 
+    # IOrganizationController
+
+    def edit(self, entity):
+        utils.invalidate_remote_organization(entity.id)
+
+    def delete(self, entity):
+        utils.invalidate_remote_organization(entity.id)
+
     # Based on ckanext-webhooks plugin
     # IDomainObjectNotification & IResourceURLChange
     def notify(self, entity, operation=None):
@@ -60,6 +78,9 @@ def _get_topic(operation: str) -> Topic:
     if operation == DomainObjectOperation.changed:
         return Topic.update
 
+    if operation == DomainObjectOperation.deleted:
+        return Topic.delete
+
     return Topic.unknown
 
 
@@ -72,9 +93,12 @@ def _syndicate_dataset(package, operation):
         )
         return
 
-    implementations = plugins.PluginImplementations(ISyndicate)
-    skipper: ISyndicate = next(iter(implementations))
+    if topic is Topic.update and package.state == model.State.DELETED:
+        topic = Topic.delete
 
+    skipper = hooks.get_pipeline().skipper
+
+    profiles = []
     for profile in utils.get_syndicate_profiles():
         if skipper.skip_syndication(package, profile):
             log.debug(
@@ -86,4 +110,13 @@ def _syndicate_dataset(package, operation):
             continue
 
         log.debug("Syndicate <{}> to {}".format(package.id, profile.ckan_url))
-        utils.syndicate_dataset(package.id, topic, profile)
+        profiles.append(profile)
+
+    if not profiles:
+        return
+
+    if outbox.is_enabled():
+        # committed together with the package and enqueued by dispatcher
+        outbox.add(package.id, topic, profiles)
+    else:
+        utils.syndicate_package(package.id, topic, profiles)
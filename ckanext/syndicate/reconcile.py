@@ -0,0 +1,268 @@
+"""Detection of drift between local and remote portals.
+
+Remote packages are listed page by page, sorted by ID, and merged with
+local sync states, sorted by ID of the remote package. Only one page of
+each side is kept in memory. Result is the sequence of changes that bring
+remote portal in sync with the local one:
+
+* create - eligible local package is not syndicated or its remote package
+  was removed;
+* update - local package was modified after the last syndication, or
+  remote package was modified by someone else. Local modification time is
+  compared with the time of the last syndication and remote one with the
+  modification time, reported by remote portal during the last
+  syndication. Clocks of different portals are never compared;
+* delete - remote package exists, but local package was removed or is not
+  syndicated to the profile anymore;
+* orphan - remote package is not tracked by any local package. It's
+  reported, but never removed automatically.
+
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+
+import ckan.model as model
+import sqlalchemy as sa
+
+from . import bulk, tasks, utils
+from .model import STATUS_DELETED, STATUS_SYNCED, SyncState
+from .types import Profile, Topic
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+ORPHAN = "orphan"
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+class Change(NamedTuple):
+    kind: str
+    package_id: Optional[str]
+    remote_id: Optional[str]
+
+
+class LocalState(NamedTuple):
+    remote_id: str
+    package_id: str
+    status: str
+    last_synced_at: Optional[datetime.datetime]
+    # metadata_modified of remote package, saved during syndication
+    remote_modified: Optional[datetime.datetime]
+    metadata_modified: Optional[datetime.datetime]
+    eligible: bool
+
+
+class RemotePackage(NamedTuple):
+    id: str
+    metadata_modified: Optional[datetime.datetime]
+
+
+def reconcile(
+    profile: Profile, page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[Change]:
+    """Compare local and remote portals and yield required changes."""
+    yield from merge(
+        iter_local_states(profile, page_size),
+        iter_remote_packages(profile, page_size),
+    )
+
+    ids = bulk.iter_package_ids(unsynced_packages_query(profile), page_size)
+    for package_id, eligible in bulk.iter_eligible(ids, [profile], page_size):
+        if eligible:
+            yield Change(CREATE, package_id, None)
+
+
+def apply(change: Change, profile: Profile):
+    """Enqueue syndication that eliminates the drift."""
+    if change.kind == DELETE:
+        state = SyncState.get(change.package_id, profile.id)
+        if state and state.status == STATUS_DELETED:
+            # remote package was restored after deletion
+            state.status = STATUS_SYNCED
+            model.Session.commit()
+        utils.syndicate_dataset(change.package_id, Topic.delete, profile)
+
+    elif change.kind in (CREATE, UPDATE):
+        # remote package may differ from the last syndicated payload
+        utils.drop_payload_hash(change.package_id, profile)
+        utils.syndicate_dataset(change.package_id, Topic.update, profile)
+
+
+def merge(
+    local: Iterable[LocalState], remote: Iterable[RemotePackage]
+) -> Iterator[Change]:
+    """Merge two sequences, sorted by ID of the remote package."""
+    local = iter(local)
+    remote = iter(remote)
+    loc = next(local, None)
+    rem = next(remote, None)
+
+    while loc or rem:
+        if rem is None or loc and loc.remote_id < rem.id:
+            # remote package is missing
+            assert loc is not None
+            if loc.eligible:
+                yield Change(CREATE, loc.package_id, loc.remote_id)
+            loc = next(local, None)
+
+        elif loc is None or rem.id < loc.remote_id:
+            yield Change(ORPHAN, None, rem.id)
+            rem = next(remote, None)
+
+        else:
+            change = _compare(loc, rem)
+            if change:
+                yield change
+            loc = next(local, None)
+            rem = next(remote, None)
+
+
+def _compare(loc: LocalState, rem: RemotePackage) -> Optional[Change]:
+    if not loc.eligible:
+        return Change(DELETE, loc.package_id, rem.id)
+
+    if loc.status == STATUS_DELETED or not loc.last_synced_at:
+        return Change(UPDATE, loc.package_id, rem.id)
+
+    if loc.metadata_modified and loc.metadata_modified > loc.last_synced_at:
+        return Change(UPDATE, loc.package_id, rem.id)
+
+    # states saved before remote modification time was recorded cannot
+    # detect remote changes until the next syndication
+    if rem.metadata_modified and loc.remote_modified:
+        if _truncate(rem.metadata_modified) != _truncate(loc.remote_modified):
+            return Change(UPDATE, loc.package_id, rem.id)
+
+    return None
+
+
+def iter_local_states(
+    profile: Profile, page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[LocalState]:
+    """Stream sync states of the profile, sorted by ID of remote package."""
+    # the same byte order as used by Solr, regardless of DB locale
+    remote_id = SyncState.remote_id.collate("C")
+    query = (
+        model.Session.query(
+            SyncState.remote_id,
+            SyncState.package_id,
+            SyncState.status,
+            SyncState.last_synced_at,
+            SyncState.remote_modified,
+            model.Package.metadata_modified,
+            model.Package.state,
+        )
+        .outerjoin(model.Package, model.Package.id == SyncState.package_id)
+        .filter(
+            SyncState.profile_id == profile.id,
+            SyncState.remote_id.isnot(None),
+        )
+        .order_by(remote_id)
+    )
+
+    last_id = None
+    while True:
+        page = query
+        if last_id is not None:
+            page = page.filter(remote_id > last_id)
+        rows = page.limit(page_size).all()
+        if not rows:
+            return
+
+        eligible = bulk.eligible_package_ids(
+            profile,
+            [row.package_id for row in rows if row.state is not None],
+        )
+        for row in rows:
+            yield LocalState(
+                row.remote_id,
+                row.package_id,
+                row.status,
+                row.last_synced_at,
+                row.remote_modified,
+                row.metadata_modified,
+                row.state == model.State.ACTIVE and row.package_id in eligible,
+            )
+        last_id = rows[-1].remote_id
+
+
+def iter_remote_packages(
+    profile: Profile, page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[RemotePackage]:
+    """Stream packages of the remote portal, sorted by ID.
+
+    Keyset pagination is used instead of `start`, so that packages created
+    or removed while listing is in progress do not shift pages.
+
+    """
+    ckan = tasks.get_target(profile.ckan_url, profile.api_key)
+    fq = remote_filter(profile, ckan)
+
+    last_id = None
+    while True:
+        page_fq = list(fq)
+        if last_id is not None:
+            page_fq.append('id:{{"{}" TO *]'.format(last_id))
+
+        result = ckan.call_action(
+            "package_search",
+            {
+                "fq": " AND ".join(page_fq) or "*:*",
+                "sort": "id asc",
+                "rows": page_size,
+                "fl": "id,metadata_modified",
+                "include_private": True,
+            },
+        )
+        packages = result["results"]
+        if not packages:
+            return
+
+        for pkg in packages:
+            yield RemotePackage(
+                pkg["id"], utils.parse_date(pkg.get("metadata_modified"))
+            )
+        last_id = packages[-1]["id"]
+
+
+def remote_filter(profile: Profile, ckan: Any) -> list[str]:
+    """Filters of remote packages, syndicated by the profile."""
+    fq = []
+    if profile.replicate_organization:
+        # organizations are replicated, but the name prefix is common
+        if profile.name_prefix:
+            fq.append("name:{}-*".format(profile.name_prefix))
+    elif profile.organization:
+        org = ckan.call_action(
+            "organization_show",
+            {"id": profile.organization, "include_datasets": False},
+        )
+        fq.append('owner_org:"{}"'.format(org["id"]))
+    return fq
+
+
+def unsynced_packages_query(profile: Profile) -> Any:
+    """Query eligible packages that were never syndicated to the profile."""
+    state = sa.and_(
+        SyncState.package_id == model.Package.id,
+        SyncState.profile_id == profile.id,
+    )
+    return (
+        bulk.eligible_packages_query(profile)
+        .outerjoin(SyncState, state)
+        .filter(
+            model.Package.state == model.State.ACTIVE,
+            sa.or_(
+                SyncState.package_id.is_(None),
+                SyncState.remote_id.is_(None),
+            ),
+        )
+    )
+
+
+def _truncate(value: datetime.datetime) -> datetime.datetime:
+    # Solr keeps only milliseconds, while API reports microseconds
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import threading
+import uuid
+from typing import IO, Any, Optional
+from urllib.parse import urlparse
+
+import ckan.plugins.toolkit as tk
+import ckanapi
+import requests
+from ckanapi.common import reverse_apicontroller_action
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import limits, metrics
+
+CONFIG_POOL_SIZE = "ckanext.syndicate.remote.pool_size"
+CONFIG_RETRIES = "ckanext.syndicate.remote.retries"
+CONFIG_BACKOFF_FACTOR = "ckanext.syndicate.remote.backoff_factor"
+CONFIG_TIMEOUT = "ckanext.syndicate.remote.timeout"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_TIMEOUT = 30
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_clients: dict[tuple[str, str], ckanapi.RemoteCKAN] = {}
+
+
+class InstrumentedRemoteCKAN(ckanapi.RemoteCKAN):
+    """RemoteCKAN that respects limits of the remote portal.
+
+    Requests are sent with timeout, when rate limit and circuit breaker
+    allow it. Duration and errors of remote calls are recorded.
+
+    """
+
+    def call_action(
+        self,
+        action: str,
+        data_dict: Optional[dict[str, Any]] = None,
+        context: Optional[dict[str, Any]] = None,
+        apikey: Optional[str] = None,
+        files: Optional[dict[str, Any]] = None,
+        requests_kwargs: Optional[dict[str, Any]] = None,
+    ):
+        requests_kwargs = dict(requests_kwargs or {})
+        requests_kwargs.setdefault("timeout", get_timeout())
+
+        with self._guard(action):
+            return super().call_action(
+                action,
+                data_dict,
+                context,
+                apikey,
+                files,
+                requests_kwargs,
+            )
+
+    def upload(
+        self,
+        action: str,
+        data_dict: dict[str, Any],
+        path: str,
+        filename: str,
+        field: str = "upload",
+    ) -> tuple[Any, str]:
+        """Call action, streaming the file as `field`.
+
+        File is never loaded into memory completely. Returns the result of
+        the action and SHA256 of the uploaded file.
+
+        """
+        url = "{}/api/action/{}".format(self.address.rstrip("/"), action)
+        body = MultipartStream(data_dict, field, filename, path)
+        headers = {
+            "Content-Type": body.content_type,
+            "User-Agent": self.user_agent,
+        }
+        if self.apikey:
+            headers["Authorization"] = self.apikey
+            headers["X-CKAN-API-Key"] = self.apikey
+
+        with self._guard(action), body:
+            resp = self.session.post(
+                url, data=body, headers=headers, timeout=get_timeout()
+            )
+            result = reverse_apicontroller_action(
+                url, resp.status_code, resp.text
+            )
+        return result, body.hexdigest()
+
+    @contextlib.contextmanager
+    def _guard(self, action: str):
+        # failures are reset only when they exist, so that healthy remote
+        # does not cost extra write on every call
+        failing = limits.acquire(self.address)
+
+        host = urlparse(self.address).netloc
+        try:
+            with metrics.timer("remote_call", host=host, action=action):
+                yield
+        except Exception as e:
+            if limits.is_failure(e):
+                limits.record_failure(self.address)
+            elif failing:
+                limits.record_success(self.address)
+            raise
+
+        if failing:
+            limits.record_success(self.address)
+
+
+class MultipartStream(io.RawIOBase):
+    """Body of multipart/form-data request that reads file lazily.
+
+    Size of the body is known in advance, so the request is sent with
+    Content-Length and only one chunk of the file is kept in memory.
+
+    """
+
+    def __init__(
+        self, fields: dict[str, Any], name: str, filename: str, path: str
+    ):
+        self.boundary = uuid.uuid4().hex
+        self._hash = hashlib.sha256()
+        self._position = 0
+
+        head = b"".join(
+            self._part_header(key, None) + str(value).encode() + b"\r\n"
+            for key, value in fields.items()
+            if value is not None
+        ) + self._part_header(name, filename)
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+        self._file = open(path, "rb")
+        self._size = len(head) + os.path.getsize(path) + len(tail)
+        self._parts: list[IO[bytes]] = [
+            io.BytesIO(head),
+            self._file,
+            io.BytesIO(tail),
+        ]
+
+    def _part_header(self, name: str, filename: Optional[str]) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            safe = filename.replace('"', "")
+            disposition += f'; filename="{safe}"'
+            headers = (
+                f"Content-Disposition: {disposition}\r\n"
+                "Content-Type: application/octet-stream\r\n"
+            )
+        else:
+            headers = f"Content-Disposition: {disposition}\r\n"
+        return f"--{self.boundary}\r\n{headers}\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._size
+
+    def hexdigest(self) -> str:
+        """SHA256 of the file content, read so far."""
+        return self._hash.hexdigest()
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # requests computes Content-Length as len() - tell(). Default
+        # implementation raises an error and body is sent in chunks, that
+        # are rejected by some servers
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            part = self._parts[0]
+            chunk = part.read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+
+            if part is self._file:
+                self._hash.update(chunk)
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+        data = b"".join(chunks)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def get_timeout() -> float:
+    return float(tk.config.get(CONFIG_TIMEOUT, DEFAULT_TIMEOUT))
+
+
+def get_client(url: str, api_key: str) -> ckanapi.RemoteCKAN:
+    """Return RemoteCKAN that reuses connections to the remote portal.
+
+    Clients are cached per process and share the same requests' session.
+    Cache is dropped after fork, so in RQ work-horse connections are reused
+    only by requests of the current job.
+
+    """
+    key = (url, api_key)
+    client = _clients.get(key)
+    if client:
+        return client
+
+    with _lock:
+        if key not in _clients:
+            _clients[key] = InstrumentedRemoteCKAN(
+                url, apikey=api_key, session=_get_session()
+            )
+        return _clients[key]
+
+
+def reset_clients():
+    """Close all the connections and forget cached clients."""
+    global _session
+
+    with _lock:
+        _clients.clear()
+        if _session:
+            _session.close()
+        _session = None
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def make_session() -> requests.Session:
+    """Create session with connection pool and retries."""
+    pool_size = tk.asint(tk.config.get(CONFIG_POOL_SIZE, DEFAULT_POOL_SIZE))
+
+    # remote actions are called with POST, that is not retried on error
+    # responses. Connection errors are retried for every method, as request
+    # was not received by remote portal.
+    retries = Retry(
+        total=tk.asint(tk.config.get(CONFIG_RETRIES, DEFAULT_RETRIES)),
+        read=0,
+        backoff_factor=float(
+            tk.config.get(CONFIG_BACKOFF_FACTOR, DEFAULT_BACKOFF_FACTOR)
+        ),
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+    )
+
+    session = requests.Session()
+    session.headers["Connection"] = "keep-alive"
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _after_fork():
+    global _lock, _session, _clients
+
+    # lock could be acquired by other thread at the moment of fork and
+    # connections must not be shared with parent process
+    _lock = threading.Lock()
+    _session = None
+    _clients = {}
+
+
+# RQ worker forks on every job. Work-horse must not use connections of the
+# parent, so it opens new ones and they are closed when the job is finished
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
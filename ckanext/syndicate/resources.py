@@ -0,0 +1,314 @@
+"""Syndication of resources.
+
+By default, resources are sent inside the package and remote portal
+replaces all of them on every update. Two per-profile options change it:
+
+* `resource_diff` - resources are excluded from the package and every
+  local resource is mapped to the remote one. Only resources that were
+  added, modified or removed locally are created, patched or deleted on the
+  remote portal, so remote resources keep their IDs and views.
+* `upload_files` - files of uploaded resources are copied to the remote
+  portal, instead of linking remote resources to the local portal. Files
+  are streamed from the local storage and sent again only when their size
+  or content was changed.
+
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional
+
+import ckan.plugins.toolkit as tk
+from ckan import model
+from ckan.lib import uploader
+
+from . import metrics
+from .model import ResourceState
+from .types import Profile
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+
+def uploads_enabled(profile: Profile) -> bool:
+    return tk.asbool(profile.upload_files)
+
+
+def diff_enabled(profile: Profile) -> bool:
+    return tk.asbool(profile.resource_diff)
+
+
+def prepare(
+    package_id: str, resources: list[dict[str, Any]], profile: Profile
+) -> Optional[list[dict[str, Any]]]:
+    """Resources for the remote package.
+
+    `None` means that resources are not sent with the package and synced
+    separately.
+
+    Uploaded resources that were already copied keep their remote ID, so
+    that remote portal does not drop them. New uploads are created
+    separately, after the remote package.
+
+    """
+    if diff_enabled(profile):
+        return None
+
+    if not uploads_enabled(profile):
+        return [_prepare_link(res) for res in resources]
+
+    states = ResourceState.for_package(package_id, profile.id)
+    result = []
+    for res in resources:
+        if res.get("url_type") != "upload":
+            result.append(_prepare_link(res))
+            continue
+
+        state = states.get(res["id"])
+        if state and state.remote_id:
+            result.append(
+                {
+                    "id": state.remote_id,
+                    "name": res["name"],
+                    "url": state.remote_url,
+                    "url_type": "upload",
+                }
+            )
+    return result
+
+
+def forget(package_id: str, profile: Profile):
+    """Drop remote resources of the package, e.g, when it's recreated."""
+    if not uploads_enabled(profile) and not diff_enabled(profile):
+        return
+
+    model.Session.query(ResourceState).filter(
+        ResourceState.package_id == package_id,
+        ResourceState.profile_id == profile.id,
+    ).delete(synchronize_session=False)
+
+
+def sync(
+    package: dict[str, Any],
+    profile: Profile,
+    ckan: Any,
+    remote_package: dict[str, Any],
+) -> bool:
+    """Create, update or delete remote resources of the package.
+
+    Returns True if remote package was modified.
+
+    """
+    uploads = uploads_enabled(profile)
+    diff = diff_enabled(profile)
+    if not uploads and not diff:
+        return False
+
+    states = ResourceState.for_package(package["id"], profile.id)
+    remote = {r["id"]: r for r in remote_package.get("resources", [])}
+    # remote resources that must not be removed
+    kept: set[str] = set()
+    # remote resources mapped to local ones, that cannot be adopted
+    taken = {state.remote_id for state in states.values()}
+    changed = False
+
+    for res in package["resources"]:
+        state = states.pop(res["id"], None)
+        if state is None:
+            state = ResourceState(
+                resource_id=res["id"],
+                profile_id=profile.id,
+                package_id=package["id"],
+            )
+
+        if uploads and res.get("url_type") == "upload":
+            changed |= _sync_upload(
+                res, state, profile, ckan, remote_package, remote
+            )
+        elif diff:
+            changed |= _sync_link(
+                res, state, ckan, remote_package, remote, taken
+            )
+
+        if state.remote_id:
+            if state not in model.Session:
+                model.Session.add(state)
+            kept.add(state.remote_id)
+            taken.add(state.remote_id)
+        model.Session.commit()
+
+    if diff:
+        for remote_id in remote:
+            if remote_id in kept:
+                continue
+            log.info(
+                "Remove resource %s from %s", remote_id, remote_package["id"]
+            )
+            ckan.action.resource_delete(id=remote_id)
+            changed = True
+
+    # resources that were removed locally
+    for state in states.values():
+        model.Session.delete(state)
+    model.Session.commit()
+    return changed
+
+
+def _prepare_link(res: dict[str, Any]) -> dict[str, Any]:
+    return {"url": res["url"], "name": res["name"]}
+
+
+def _compute_hash(data: dict[str, Any]) -> str:
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def _sync_link(
+    res: dict[str, Any],
+    state: ResourceState,
+    ckan: Any,
+    remote_package: dict[str, Any],
+    remote: dict[str, dict[str, Any]],
+    taken: set[str],
+) -> bool:
+    data = _prepare_link(res)
+    payload_hash = _compute_hash(data)
+
+    if state.remote_id not in remote:
+        state.remote_id = _adopt(data, remote, taken)
+        if state.remote_id:
+            # remote resource is identical to the local one
+            state.remote_url = remote[state.remote_id].get("url")
+            state.payload_hash = payload_hash
+            state.touch()
+            return False
+
+    if state.remote_id and state.payload_hash == payload_hash:
+        return False
+
+    if state.remote_id:
+        remote_res = ckan.action.resource_patch(id=state.remote_id, **data)
+    else:
+        remote_res = ckan.action.resource_create(
+            package_id=remote_package["id"], **data
+        )
+
+    state.remote_id = remote_res["id"]
+    state.remote_url = remote_res["url"]
+    state.payload_hash = payload_hash
+    state.touch()
+    return True
+
+
+def _adopt(
+    data: dict[str, Any],
+    remote: dict[str, dict[str, Any]],
+    taken: set[str],
+) -> Optional[str]:
+    """Find untracked remote resource that is identical to the local one.
+
+    Used when remote resources were created before the resource diffing
+    was enabled.
+
+    """
+    for remote_id, remote_res in remote.items():
+        if remote_id in taken:
+            continue
+        if all(remote_res.get(k) == v for k, v in data.items()):
+            return remote_id
+    return None
+
+
+def _sync_upload(
+    res: dict[str, Any],
+    state: ResourceState,
+    profile: Profile,
+    ckan: Any,
+    remote_package: dict[str, Any],
+    remote: dict[str, dict[str, Any]],
+) -> bool:
+    """Copy new or modified file of the uploaded resource."""
+    path = _get_path(res)
+    if not path:
+        log.warning(
+            "File of resource %s is not available in local storage."
+            " Skip upload",
+            res["id"],
+        )
+        return False
+
+    # remote resource may be removed
+    exists = state.remote_id in remote
+    if exists and not _file_changed(state, path):
+        return False
+
+    data = {"name": res["name"], "url": _filename(res)}
+    if exists:
+        action = "resource_update"
+        data["id"] = state.remote_id
+    else:
+        action = "resource_create"
+        data["package_id"] = remote_package["id"]
+
+    log.info(
+        "Upload file of resource %s to %s using %s",
+        res["id"],
+        profile.id,
+        action,
+    )
+    stat = os.stat(path)
+    remote_res, file_hash = ckan.upload(action, data, path, _filename(res))
+    metrics.incr("uploaded_bytes", stat.st_size, profile=profile.id)
+
+    state.remote_id = remote_res["id"]
+    state.remote_url = remote_res["url"]
+    state.size = stat.st_size
+    state.mtime = stat.st_mtime
+    state.file_hash = file_hash
+    state.touch()
+    return True
+
+
+def _file_changed(state: ResourceState, path: str) -> bool:
+    stat = os.stat(path)
+    if stat.st_size != state.size:
+        return True
+
+    if stat.st_mtime == state.mtime:
+        return False
+
+    # file was rewritten, but may have the same content
+    changed = _file_hash(path) != state.file_hash
+    if not changed:
+        state.mtime = stat.st_mtime
+    return changed
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as src:
+        for chunk in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_path(res: dict[str, Any]) -> Optional[str]:
+    # uploader modifies resource dict
+    upload = uploader.get_resource_uploader(dict(res))
+    get_path = getattr(upload, "get_path", None)
+    if not get_path:
+        # non-filesystem storage
+        return None
+
+    path = get_path(res["id"])
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def _filename(res: dict[str, Any]) -> str:
+    return res["url"].rstrip("/").rsplit("/", 1)[-1] or res["id"]
@@ -1,32 +1,203 @@
 from __future__ import annotations
 
 import contextlib
+import copy
 import logging
 import uuid
-from typing import Any, Optional
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Collection, Iterable, Optional
 
-import ckan.plugins as plugins
 import ckan.plugins.toolkit as tk
 import ckanapi
-import requests
 from ckan import model
+from ckan.lib.munge import munge_filename
 from ckan.lib.search import rebuild
 
-from ckanext.syndicate.interfaces import ISyndicate
-
-from . import signals
+from . import (
+    cache,
+    hooks,
+    images,
+    limits,
+    metrics,
+    remote,
+    resources,
+    signals,
+    utils,
+)
+from .model import STATUS_DELETED, SyncState
 from .types import Profile, Topic
 from .utils import deprecated
 
+# fields of the package used by syndication itself
+LEAN_BASE_FIELDS = frozenset(["id", "name", "state", "owner_org", "private"])
+# prefix of the field that requests a single extra. Used for extras required
+# by syndication itself, even when profile does not list `extras`
+LEAN_EXTRA_PREFIX = "extras."
+
 log = logging.getLogger(__name__)
 
 
 def get_target(url, apikey):
-    ckan = ckanapi.RemoteCKAN(url, apikey=apikey)
-    return ckan
+    return remote.get_client(url, apikey)
+
+
+def sync_package(
+    package_id: str, action: Topic, profile: Profile, notified: bool = False
+) -> bool:
+    """Syndicate the package to the profile.
+
+    `notified` is set when `before_syndication` was already sent by the
+    caller. Returns `False` if syndication was deferred.
+
+    """
+    if action is Topic.delete:
+        _log_sync(package_id, action, profile)
+        return _delete([package_id], profile)
+
+    # load the package at run of time task (rather than use package state at
+    # time of task creation).
+    package = load_package(package_id, get_snapshot_fields([profile]))
+    try:
+        _sync_loaded(package, action, profile, notified)
+    except limits.RemoteUnavailable as e:
+        model.Session.rollback()
+        _defer([package_id], action, profile, e)
+        return False
+    except Exception as e:
+        model.Session.rollback()
+        schedule_retry([package_id], action, profile, e)
+        raise
+    return True
 
 
-def sync_package(package_id: str, action: Topic, profile: Profile):
+def _defer(
+    package_ids: Iterable[str],
+    action: Topic,
+    profile: Profile,
+    error: limits.RemoteUnavailable,
+):
+    log.warning(
+        "Defer syndication to %s for %s seconds: %s",
+        profile.id,
+        int(error.retry_after),
+        error,
+    )
+    for package_id in package_ids:
+        utils.defer_syndication(package_id, action, profile, error.retry_after)
+    metrics.incr("deferred", profile=profile.id)
+
+
+def schedule_retry(
+    package_ids: Iterable[str],
+    action: Topic,
+    profile: Profile,
+    error: Exception,
+    transient: Optional[bool] = None,
+):
+    """Retry failed syndication later or move it to the dead-letter store.
+
+    Only errors of unhealthy remote portal are retried by default. Other
+    errors are not expected to disappear without intervention.
+
+    """
+    if transient is None:
+        transient = limits.is_failure(error)
+
+    for package_id in package_ids:
+        if utils.retry_syndication(
+            package_id, action, profile, error, transient
+        ):
+            metrics.incr("retried", profile=profile.id)
+        else:
+            log.error(
+                "Syndication of %s to %s failed: %s. Use `ckan syndicate"
+                " failures replay` when the problem is solved",
+                package_id,
+                profile.id,
+                error,
+            )
+            metrics.incr("dead_lettered", profile=profile.id)
+
+
+@metrics.job("sync_package_profiles")
+def sync_package_profiles(
+    package_id: str,
+    action: Topic,
+    profiles: list[Profile],
+    pending: bool = False,
+):
+    """Sync package with multiple profiles, loading it only once.
+
+    When `pending` flag is set, actions are taken from the debouncer.
+
+    """
+    _counters, errors = sync_profiles(
+        package_id, [(action, profile) for profile in profiles], pending
+    )
+    if errors:
+        # mark RQ job as failed
+        raise errors[0]
+
+
+def sync_profiles(
+    package_id: str,
+    items: Iterable[tuple[Topic, Profile]],
+    pending: bool = False,
+    throttle: Optional[Callable[[Profile], Any]] = None,
+) -> tuple[Counter[str], list[Exception]]:
+    """Sync package with every profile and return stats and errors.
+
+    Failure of one profile does not prevent syndication to other
+    profiles. `throttle` is called before syndication to the profile.
+
+    """
+    counters: Counter[str] = Counter()
+    errors: list[Exception] = []
+    package = None
+
+    items = list(items)
+    fields = get_snapshot_fields(profile for _, profile in items)
+
+    for action, profile in items:
+        if pending:
+            action = utils.pop_pending(package_id, profile)
+            if action is None:
+                continue
+
+        try:
+            if throttle:
+                throttle(profile)
+
+            if action is Topic.delete:
+                _log_sync(package_id, action, profile)
+                _delete([package_id], profile)
+            else:
+                if package is None:
+                    package = load_package(package_id, fields)
+                # every profile modifies its own copy of the package
+                _sync_loaded(copy.deepcopy(package), action, profile)
+
+        except limits.RemoteUnavailable as e:
+            model.Session.rollback()
+            _defer([package_id], action, profile, e)
+            counters["deferred"] += 1
+        except Exception as e:
+            log.exception(
+                "Cannot syndicate %s for profile %s", package_id, profile.id
+            )
+            model.Session.rollback()
+            if not isinstance(e, tk.ObjectNotFound):
+                schedule_retry([package_id], action, profile, e)
+            counters["failed"] += 1
+            errors.append(e)
+        else:
+            counters["synced"] += 1
+
+    return counters, errors
+
+
+def _log_sync(package_id: str, action: Topic, profile: Profile):
     log.info(
         "Sync package %s, with action %s to the %s",
         package_id,
@@ -34,55 +205,315 @@ def sync_package(package_id: str, action: Topic, profile: Profile):
         profile.id,
     )
 
-    # load the package at run of time task (rather than use package state at
-    # time of task creation).
+
+def _sync_loaded(
+    package: dict[str, Any],
+    action: Topic,
+    profile: Profile,
+    notified: bool = False,
+):
+    package_id = package["id"]
+    _log_sync(package_id, action, profile)
+
+    if package["state"] == model.State.DELETED:
+        log.info(
+            "Package %s was deleted. Skip %s",
+            package_id,
+            action.name,
+        )
+        return
+
     params = {
         "id": package_id,
     }
-    package: dict[str, Any] = tk.get_action("package_show")(
+    with metrics.timer("sync", profile=profile.id, action=action.name):
+        if not notified:
+            _notify_before(package_id, profile, params)
+
+        if action is Topic.create:
+            _create(package, profile)
+        elif action is Topic.update:
+            _update(package, profile)
+
+        _notify_after(package_id, profile, params)
+
+
+def load_package(
+    package_id: str, fields: Optional[Collection[str]] = None
+) -> dict[str, Any]:
+    """Load the package that will be syndicated.
+
+    If `fields` are specified, only these fields are loaded from DB,
+    bypassing `package_show`. Otherwise, the complete package dictionary
+    is returned.
+
+    """
+    if fields is not None:
+        return _load_lean_package(package_id, fields)
+
+    return tk.get_action("package_show")(
         {
             "ignore_auth": True,
             "use_cache": False,
             "validate": False,
         },
-        params,
+        {"id": package_id},
     )
 
-    _notify_before(package_id, profile, params)
 
-    if action is Topic.create:
-        _create(package, profile)
-    elif action is Topic.update:
-        _update(package, profile)
+def get_snapshot_fields(
+    profiles: Iterable[Profile],
+) -> Optional[frozenset[str]]:
+    """Combine fields used by profiles.
 
-    _notify_after(package_id, profile, params)
+    `None` means that at least one profile requires complete package.
 
+    """
+    fields: set[str] = set()
+    for profile in profiles:
+        if not profile.fields:
+            return None
+        fields.update(tk.aslist(profile.fields))
+        # legacy ID of the remote package and syndication flag
+        fields.update(
+            LEAN_EXTRA_PREFIX + key for key in (profile.field_id, profile.flag)
+        )
+    return frozenset(fields)
 
-def _notify_before(package_id, profile, params):
-    try:
-        tk.get_action("before_syndication_action")(
-            {"profile": profile}, params
+
+def _load_lean_package(
+    package_id: str, fields: Collection[str]
+) -> dict[str, Any]:
+    table = model.package_table
+    columns = tuple(LEAN_BASE_FIELDS | {f for f in fields if f in table.c})
+
+    row = (
+        model.Session.query(*[table.c[name] for name in columns])
+        .filter(table.c.id == package_id)
+        .one_or_none()
+    )
+    if row is None:
+        raise tk.ObjectNotFound(f"Package {package_id} not found")
+
+    package: dict[str, Any] = {
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in zip(columns, row)
+    }
+
+    package["extras"] = []
+    keys = {
+        f[len(LEAN_EXTRA_PREFIX) :]
+        for f in fields
+        if f.startswith(LEAN_EXTRA_PREFIX)
+    }
+    if "extras" in fields or keys:
+        extras = model.Session.query(
+            model.PackageExtra.key, model.PackageExtra.value
+        ).filter(
+            model.PackageExtra.package_id == package_id,
+            model.PackageExtra.state == model.State.ACTIVE,
         )
-    except KeyError:
-        pass
-    else:
-        deprecated(
-            "before_syndication_action is deprecated. Use before_syndication"
-            " signal instead"
+        if "extras" not in fields:
+            extras = extras.filter(model.PackageExtra.key.in_(keys))
+        package["extras"] = [
+            {"key": key, "value": value} for key, value in extras
+        ]
+
+    if "tags" in fields:
+        package["tags"] = [
+            {"name": name}
+            for (name,) in model.Session.query(model.Tag.name)
+            .join(model.PackageTag)
+            .filter(
+                model.PackageTag.package_id == package_id,
+                model.PackageTag.state == model.State.ACTIVE,
+                model.Tag.vocabulary_id.is_(None),
+            )
+        ]
+
+    package["resources"] = [
+        {
+            "id": id_,
+            "url": _resource_url(package_id, id_, url, url_type),
+            "url_type": url_type,
+            "name": name,
+        }
+        for id_, url, url_type, name in model.Session.query(
+            model.Resource.id,
+            model.Resource.url,
+            model.Resource.url_type,
+            model.Resource.name,
+        )
+        .filter(
+            model.Resource.package_id == package_id,
+            model.Resource.state == model.State.ACTIVE,
+        )
+        .order_by(model.Resource.position)
+    ]
+
+    package["organization"] = None
+    if package["owner_org"]:
+        org = model.Group.get(package["owner_org"])
+        if org:
+            package["organization"] = _lean_organization(org)
+
+    return package
+
+
+def _resource_url(
+    package_id: str, resource_id: str, url: str, url_type: Optional[str]
+) -> str:
+    # the same transformation is applied by resource_dictize
+    if url_type == "upload" and url and not url.startswith("http"):
+        return tk.url_for(
+            "resource.download",
+            id=package_id,
+            resource_id=resource_id,
+            filename=munge_filename(url.rsplit("/")[-1]),
+            qualified=True,
+        )
+    return url
+
+
+def _lean_organization(org: model.Group) -> dict[str, Any]:
+    image_url = org.image_url or ""
+    image_display_url = image_url
+    if image_url and not image_url.startswith("http"):
+        image_display_url = tk.h.url_for_static(
+            "uploads/group/{}".format(image_url), qualified=True
+        )
+
+    data = {
+        "id": org.id,
+        "name": org.name,
+        "title": org.title,
+        "description": org.description,
+        "type": org.type,
+        "is_organization": org.is_organization,
+        "approval_status": org.approval_status,
+        "state": org.state,
+        "image_url": image_url,
+    }
+    if image_display_url:
+        data["image_display_url"] = image_display_url
+    return data
+
+
+@metrics.job("sync_package")
+def sync_package_job(package_id: str, action: Topic, profile: Profile):
+    """Sync package with the profile in the background job."""
+    sync_package(package_id, action, profile)
+
+
+@metrics.job("sync_pending_package")
+def sync_pending_package(package_id: str, action: Topic, profile: Profile):
+    """Sync package using all the changes accumulated by debouncer."""
+    pending = utils.pop_pending(package_id, profile)
+    if pending is None:
+        log.debug(
+            "Package %s was already synchronized with the profile %s",
+            package_id,
+            profile.id,
+        )
+        return
+
+    sync_package(package_id, pending, profile)
+
+
+@metrics.job("delete_packages")
+def delete_packages(profile: Profile):
+    """Remove from the remote portal packages that were deleted locally."""
+    package_ids = utils.pop_pending_deletes(profile)
+    if package_ids:
+        _delete(package_ids, profile)
+
+
+def _delete(package_ids: list[str], profile: Profile) -> bool:
+    """Remove remote packages. Returns `False` if removal was deferred."""
+    ckan = get_target(profile.ckan_url, profile.api_key)
+    action = "dataset_purge" if tk.asbool(profile.purge) else "package_delete"
+
+    remote_ids = _get_remote_ids(package_ids, profile)
+    for idx, (package_id, remote_id) in enumerate(remote_ids):
+        log.info(
+            "Remove package %s from the %s using %s",
+            package_id,
+            profile.id,
+            action,
+        )
+        params = {"id": package_id}
+        _notify_before(package_id, profile, params)
+
+        try:
+            ckan.call_action(action, {"id": remote_id})
+        except ckanapi.NotFound:
+            log.info("Remote package %s is already removed", remote_id)
+        except limits.RemoteUnavailable as e:
+            rest = [id_ for id_, _ in remote_ids[idx:]]
+            _defer(rest, Topic.delete, profile, e)
+            return False
+        except Exception as e:
+            log.exception(
+                "Cannot remove package %s from %s", package_id, profile.id
+            )
+            schedule_retry([package_id], Topic.delete, profile, e)
+            continue
+
+        state = SyncState.get_or_create(package_id, profile.id)
+        state.remote_id = remote_id
+        state.payload_hash = None
+        state.touch(STATUS_DELETED)
+        model.Session.commit()
+
+        _notify_after(package_id, profile, params)
+
+    return True
+
+
+def _get_remote_ids(
+    package_ids: list[str], profile: Profile
+) -> list[tuple[str, str]]:
+    states = model.Session.query(
+        SyncState.package_id, SyncState.remote_id, SyncState.status
+    ).filter(
+        SyncState.profile_id == profile.id,
+        SyncState.package_id.in_(package_ids),
+    )
+
+    remote_ids = []
+    known = set()
+    for package_id, remote_id, status in states:
+        known.add(package_id)
+        if remote_id and status != STATUS_DELETED:
+            remote_ids.append((package_id, remote_id))
+
+    # packages syndicated before introduction of the sync state table
+    legacy = [id_ for id_ in package_ids if id_ not in known]
+    if legacy:
+        remote_ids.extend(
+            model.Session.query(
+                model.PackageExtra.package_id, model.PackageExtra.value
+            ).filter(
+                model.PackageExtra.package_id.in_(legacy),
+                model.PackageExtra.key == profile.field_id,
+                model.PackageExtra.state == model.State.ACTIVE,
+            )
         )
+
+    return remote_ids
+
+
+def _notify_before(package_id, profile, params):
+    action = hooks.get_pipeline().before_action
+    if action:
+        action({"profile": profile}, params)
     signals.before_syndication.send(package_id, profile=profile, params=params)
 
 
 def _notify_after(package_id, profile, params):
-    try:
-        tk.get_action("after_syndication_action")({"profile": profile}, params)
-    except KeyError:
-        pass
-    else:
-        deprecated(
-            "after_syndication_action is deprecated. Use after_syndication"
-            " signal instead"
-        )
+    action = hooks.get_pipeline().after_action
+    if action:
+        action({"profile": profile}, params)
     signals.after_syndication.send(package_id, profile=profile, params=params)
 
 
@@ -105,24 +536,51 @@ def replicate_remote_organization(org: dict[str, Any], profile: Profile):
 
     if not remote_org:
         org.pop("id")
-        org.pop("image_url", None)
         org.pop("num_followers", None)
         org.pop("tags", None)
         org.pop("users", None)
         org.pop("groups", None)
 
-        default_img_url = (
-            "https://www.gravatar.com/avatar/123?s=400&d=identicon"
-        )
-        image_url = org.pop("image_display_url", default_img_url)
-        image_fd = requests.get(image_url, stream=True, timeout=2).raw
-        org.update(image_upload=image_fd)
+        # image is sent by the separate job, so that slow image does not
+        # block syndication of the package
+        image = {
+            "image_url": org.pop("image_url", None),
+            "image_display_url": org.pop("image_display_url", None),
+        }
 
         remote_org = ckan.action.organization_create(**org)
 
+        if images.has_image(image):
+            tk.enqueue_job(
+                sync_organization_image,
+                [remote_org["id"], image, profile],
+                queue=utils.get_queue(profile),
+            )
+
     return remote_org["id"]
 
 
+@metrics.job("sync_organization_image")
+def sync_organization_image(
+    remote_id: str, image: dict[str, Any], profile: Profile
+):
+    """Upload image of the local organization to the remote one."""
+    found = images.get_image(image)
+    if not found:
+        log.warning(
+            "Image of organization %s is not available. Skip upload",
+            remote_id,
+        )
+        return
+
+    path, filename = found
+    ckan = get_target(profile.ckan_url, profile.api_key)
+    log.info("Upload image of organization %s to %s", remote_id, profile.id)
+    ckan.upload(
+        "organization_patch", {"id": remote_id}, path, filename, "image_upload"
+    )
+
+
 def _create(package: dict[str, Any], profile: Profile):
     ckan = get_target(profile.ckan_url, profile.api_key)
 
@@ -132,40 +590,100 @@ def _create(package: dict[str, Any], profile: Profile):
 
     new_package_data["name"] = _compute_remote_name(package, profile)
 
+    # remote resources are created together with the new remote package
+    resources.forget(package["id"], profile)
     new_package_data = _prepare(package["id"], new_package_data, profile)
 
     with reattaching_context(package["id"], new_package_data, profile, ckan):
         remote_package = ckan.action.package_create(**new_package_data)
-        set_syndicated_id(
-            package["id"],
-            remote_package["id"],
-            profile.field_id,
-        )
+        save_sync_state(package["id"], profile, remote_package)
+        _sync_resources(package, profile, ckan, remote_package)
 
 
 def _update(package: dict[str, Any], profile: Profile):
     ckan = get_target(profile.ckan_url, profile.api_key)
 
-    syndicated_id: Optional[str] = tk.h.get_pkg_dict_extra(
-        package, profile.field_id
-    )
+    syndicated_id = get_syndicated_id(package, profile)
     if not syndicated_id:
         return _create(package, profile)
-    try:
-        remote_package = ckan.action.package_show(id=syndicated_id)
-    except ckanapi.NotFound:
-        return _create(package, profile)
 
+    # remote package is read only when it must be written, unless
+    # resources are diffed against it
+    remote_package = None
+    state = SyncState.get(package["id"], profile.id)
+    if (
+        state
+        and state.status != STATUS_DELETED
+        and state.remote_id == syndicated_id
+        and state.remote_name
+        and not resources.uploads_enabled(profile)
+        and not resources.diff_enabled(profile)
+    ):
+        target = {"id": state.remote_id, "name": state.remote_name}
+    else:
+        try:
+            remote_package = ckan.action.package_show(id=syndicated_id)
+        except ckanapi.NotFound:
+            return _create(package, profile)
+        target = remote_package
+
+    updated_package = _prepare_update(package, target, profile)
+
+    payload_hash = utils.compute_payload_hash(updated_package)
+    if payload_hash == utils.get_payload_hash(package["id"], profile):
+        log.info(
+            "Package %s was not changed since the last syndication to %s."
+            " Skip remote update",
+            package["id"],
+            profile.id,
+        )
+        utils.count_skipped_write(profile)
+        if remote_package is None:
+            state.touch()
+            model.Session.commit()
+            return
+        save_sync_state(package["id"], profile, remote_package, payload_hash)
+    else:
+        if remote_package is None:
+            try:
+                remote_package = ckan.action.package_show(id=syndicated_id)
+            except ckanapi.NotFound:
+                return _create(package, profile)
+
+            if remote_package["name"] != target["name"]:
+                # remote package was renamed
+                updated_package = _prepare_update(
+                    package, remote_package, profile
+                )
+                payload_hash = utils.compute_payload_hash(updated_package)
+
+        action = "package_update"
+        if "resources" not in updated_package:
+            # package_update would drop remote resources
+            action = "package_patch"
+        with reattaching_context(
+            package["id"], updated_package, profile, ckan
+        ):
+            remote_package = ckan.call_action(action, updated_package)
+            save_sync_state(
+                package["id"], profile, remote_package, payload_hash
+            )
+
+    # resources are diffed separately and content of files is not a part
+    # of the payload
+    _sync_resources(package, profile, ckan, remote_package)
+
+
+def _prepare_update(
+    package: dict[str, Any], remote_package: dict[str, Any], profile: Profile
+) -> dict[str, Any]:
     # TODO: maybe we should do deepcopy
     updated_package = dict(package)
     # Keep the existing remote ID and Name
     updated_package["id"] = remote_package["id"]
     updated_package["name"] = remote_package["name"]
 
-    updated_package = _prepare(package["id"], updated_package, profile)
-
-    with reattaching_context(package["id"], updated_package, profile, ckan):
-        ckan.action.package_update(**updated_package)
+    return _prepare(package["id"], updated_package, profile)
 
 
 def _compute_remote_name(package: dict[str, Any], profile: Profile):
@@ -179,10 +697,22 @@ def _compute_remote_name(package: dict[str, Any], profile: Profile):
     return name
 
 
+def _get_remote_org_id(org: dict[str, Any], profile: Profile) -> str:
+    org_cache = cache.get_org_cache()
+    key = cache.org_cache_key(profile.id, org["id"])
+
+    org_id = org_cache.get(key)
+    if org_id is None:
+        org_id = replicate_remote_organization(org, profile)
+        org_cache.set(key, org_id)
+
+    return org_id
+
+
 def _normalize_org_id(package: dict[str, Any], profile: Profile):
     org = package.pop("organization")
     if profile.replicate_organization:
-        org_id = replicate_remote_organization(org, profile)
+        org_id = _get_remote_org_id(org, profile)
     else:
         # Take syndicated org from the profile or use global config org
         org_id = profile.organization
@@ -191,40 +721,91 @@ def _normalize_org_id(package: dict[str, Any], profile: Profile):
 
 def _prepare(
     local_id: str, package: dict[str, Any], profile: Profile
+) -> dict[str, Any]:
+    with metrics.timer("prepare", profile=profile.id):
+        return _prepare_payload(local_id, package, profile)
+
+
+def _prepare_payload(
+    local_id: str, package: dict[str, Any], profile: Profile
 ) -> dict[str, Any]:
     extras_dict = dict([(o["key"], o["value"]) for o in package["extras"]])
     extras_dict.pop(profile.field_id, None)
+    if profile.fields and "extras" not in tk.aslist(profile.fields):
+        # extras are loaded for other profiles or for syndication itself
+        extras_dict = {}
     package["extras"] = [
         {"key": k, "value": v} for (k, v) in extras_dict.items()
     ]
 
-    package["resources"] = [
-        {"url": r["url"], "name": r["name"]} for r in package["resources"]
-    ]
+    prepared = resources.prepare(local_id, package["resources"], profile)
+    if prepared is None:
+        del package["resources"]
+    else:
+        package["resources"] = prepared
     package["owner_org"] = _normalize_org_id(package, profile)
 
-    try:
-        package = tk.get_action("update_dataset_for_syndication")(
-            {},
-            {"dataset_dict": package, "package_id": local_id},
-        )
-    except KeyError:
-        pass
-    else:
-        deprecated(
-            "update_dataset_for_syndication is deprecated. Implement"
-            " ISyndicate instead"
-        )
-    for plugin in plugins.PluginImplementations(ISyndicate):
-        package = plugin.prepare_package_for_syndication(
-            local_id, package, profile
+    return hooks.get_pipeline().prepare(local_id, package, profile)
+
+
+def get_syndicated_id(
+    package: dict[str, Any], profile: Profile
+) -> Optional[str]:
+    """Get ID of the remote package."""
+    state = SyncState.get(package["id"], profile.id)
+    if state and state.remote_id:
+        return state.remote_id
+
+    # package was syndicated before introduction of the sync state table
+    return tk.h.get_pkg_dict_extra(package, profile.field_id)
+
+
+def save_sync_state(
+    local_id: str,
+    profile: Profile,
+    remote_package: dict[str, Any],
+    payload_hash: Optional[str] = None,
+):
+    """Remember the remote package synchronized with the local one."""
+    with metrics.timer("save_state", profile=profile.id):
+        state = SyncState.get_or_create(local_id, profile.id)
+        state.remote_id = remote_package["id"]
+        state.remote_name = remote_package["name"]
+        state.remote_modified = utils.parse_date(
+            remote_package.get("metadata_modified")
         )
+        state.payload_hash = payload_hash
+        state.touch()
+        model.Session.commit()
 
-    return package
+
+def _sync_resources(
+    package: dict[str, Any],
+    profile: Profile,
+    ckan: Any,
+    remote_package: dict[str, Any],
+):
+    if not resources.sync(package, profile, ckan, remote_package):
+        return
+
+    # resource actions modified remote package after the sync state was
+    # saved. Without it, reconciliation reports the package as changed by
+    # someone else.
+    remote_package = ckan.action.package_show(id=remote_package["id"])
+    state = SyncState.get(package["id"], profile.id)
+    if state:
+        state.remote_modified = utils.parse_date(
+            remote_package.get("metadata_modified")
+        )
+        model.Session.commit()
 
 
 def set_syndicated_id(local_id: str, remote_id: str, field: str):
     """Set the remote package id on the local package"""
+    deprecated(
+        "set_syndicated_id is deprecated. Syndication state is stored by"
+        " save_sync_state"
+    )
     ext_id = (
         model.Session.query(model.PackageExtra.id)
         .join(model.Package, model.Package.id == model.PackageExtra.package_id)
@@ -307,9 +888,7 @@ def reattaching_context(
 
     log.info("Author is the same({0}). Continue syndication".format(author))
 
-    ckan.action.package_update(id=remote_package["id"], **package)
-    set_syndicated_id(
-        local_id,
-        remote_package["id"],
-        profile.field_id,
+    remote_package = ckan.action.package_update(
+        id=remote_package["id"], **package
     )
+    save_sync_state(local_id, profile, remote_package)
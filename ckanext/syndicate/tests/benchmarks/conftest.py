@@ -0,0 +1,79 @@
+"""Benchmarks of the syndication hot path.
+
+Benchmarks are skipped by regular test runs. Run them with
+
+    pytest ckanext/syndicate/tests/benchmarks --benchmark-only
+
+Latency of the stand-in remote portal(in seconds) is controlled by the
+`SYNDICATE_BENCHMARK_LATENCY` environment variable.
+
+"""
+import os
+import pathlib
+
+import pytest
+from ckan.tests import factories
+
+from ckanext.syndicate import remote as remote_clients
+from ckanext.syndicate import utils
+
+from .remote import FakeRemote
+
+HERE = pathlib.Path(__file__).parent
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark_only", False):
+        return
+
+    skip = pytest.mark.skip(reason="Benchmarks require --benchmark-only")
+    for item in items:
+        if HERE in pathlib.Path(str(item.fspath)).parents:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def fake_remote():
+    latency = float(os.environ.get("SYNDICATE_BENCHMARK_LATENCY", 0))
+    remote = FakeRemote(latency)
+    remote.start()
+    yield remote
+    remote.stop()
+
+
+@pytest.fixture
+def remote(fake_remote, ckan_config, monkeypatch):
+    """Point default syndication profile to the stand-in portal."""
+    fake_remote.reset()
+    monkeypatch.setitem(
+        ckan_config, "ckan.syndicate.ckan_url", fake_remote.url
+    )
+    utils.reset_profiles()
+    remote_clients.reset_clients()
+    yield fake_remote
+    remote_clients.reset_clients()
+
+
+@pytest.fixture
+def make_datasets():
+    """Create syndicated datasets with the given number of children."""
+
+    def factory(count, resources=1, extras=1):
+        org = factories.Organization()
+        return [
+            factories.Dataset(
+                owner_org=org["id"],
+                extras=[{"key": "syndicate", "value": "true"}]
+                + [
+                    {"key": f"extra-{i}", "value": f"value {i}"}
+                    for i in range(extras)
+                ],
+                resources=[
+                    {"url": f"http://example.com/{i}.csv", "name": f"{i}"}
+                    for i in range(resources)
+                ],
+            )
+            for _ in range(count)
+        ]
+
+    return factory
@@ -0,0 +1,150 @@
+"""Stand-in for the remote CKAN portal.
+
+Implements only API actions used by syndication and keeps datasets in
+memory. Every request is delayed by the configured latency, which imitates
+network round-trip and processing time of the real portal.
+
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+
+class NotFound(Exception):
+    pass
+
+
+class FakeRemote:
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.packages: dict[str, dict[str, Any]] = {}
+        self.organizations: dict[str, dict[str, Any]] = {}
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        assert self._server
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.remote = self  # type: ignore
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset(self):
+        with self._lock:
+            self.packages.clear()
+            self.organizations.clear()
+            self.calls.clear()
+
+    def call(self, action: str, data: dict[str, Any]) -> Any:
+        if self.latency:
+            time.sleep(self.latency)
+
+        handler = getattr(self, "action_" + action, None)
+        if handler is None:
+            raise NotFound(action)
+
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            return handler(data)
+
+    def _find(self, id_: str) -> dict[str, Any]:
+        for pkg in self.packages.values():
+            if id_ in (pkg["id"], pkg["name"]):
+                return pkg
+        raise NotFound(id_)
+
+    def action_package_show(self, data: dict[str, Any]):
+        return self._find(data["id"])
+
+    def action_package_create(self, data: dict[str, Any]):
+        pkg = dict(data, id=str(uuid.uuid4()), state="active")
+        self.packages[pkg["id"]] = pkg
+        return pkg
+
+    def action_package_update(self, data: dict[str, Any]):
+        pkg = self._find(data["id"])
+        pkg.update(data)
+        return pkg
+
+    def action_package_patch(self, data: dict[str, Any]):
+        return self.action_package_update(data)
+
+    def action_package_delete(self, data: dict[str, Any]):
+        self._find(data["id"])["state"] = "deleted"
+
+    def action_dataset_purge(self, data: dict[str, Any]):
+        self.packages.pop(self._find(data["id"])["id"])
+
+    def action_organization_show(self, data: dict[str, Any]):
+        if data["id"] not in self.organizations:
+            raise NotFound(data["id"])
+        return self.organizations[data["id"]]
+
+    def action_organization_create(self, data: dict[str, Any]):
+        org = dict(data, id=str(uuid.uuid4()))
+        self.organizations[org["name"]] = org
+        return org
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_POST(self):
+        remote: FakeRemote = self.server.remote  # type: ignore
+        action = self.path.rstrip("/").rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            # multipart uploads are not inspected
+            data = {}
+
+        try:
+            result = remote.call(action, data)
+        except NotFound:
+            self._reply(
+                404,
+                {
+                    "success": False,
+                    "error": {"__type": "Not Found Error", "message": ""},
+                },
+            )
+        except Exception as e:
+            self._reply(
+                500,
+                {"success": False, "error": {"message": str(e)}},
+            )
+        else:
+            self._reply(200, {"success": True, "result": result})
+
+    def _reply(self, status: int, payload: dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,79 @@
+import ckan.model as model
+import ckan.plugins as plugins
+import pytest
+from ckan.model.domain_object import DomainObjectOperation
+
+from ckanext.syndicate import bulk, tasks, utils
+from ckanext.syndicate.types import Topic
+
+SIZES = [(1, 1), (20, 50)]
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+class TestNotify:
+    def test_notify_to_enqueue(self, benchmark, make_datasets, mocker):
+        """Overhead of the IDomainObjectModification handler."""
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        dataset = make_datasets(1)[0]
+        plugin = plugins.get_plugin("syndicate")
+        pkg = model.Package.get(dataset["id"])
+
+        benchmark(plugin.notify, pkg, DomainObjectOperation.changed)
+        assert enqueue.called
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+@pytest.mark.parametrize("resources, extras", SIZES)
+class TestSyncPackage:
+    def test_update(self, benchmark, remote, make_datasets, resources, extras):
+        """Full update of the remote dataset."""
+        dataset = make_datasets(1, resources, extras)[0]
+        profile = next(utils.get_syndicate_profiles())
+        tasks.sync_package(dataset["id"], Topic.create, profile)
+
+        benchmark.pedantic(
+            tasks.sync_package,
+            args=(dataset["id"], Topic.update, profile),
+            setup=lambda: utils.drop_payload_hash(dataset["id"], profile),
+            rounds=20,
+        )
+        assert remote.calls["package_update"] == 20
+
+    def test_unchanged(
+        self, benchmark, remote, make_datasets, resources, extras
+    ):
+        """Update that is skipped, because dataset was not changed."""
+        dataset = make_datasets(1, resources, extras)[0]
+        profile = next(utils.get_syndicate_profiles())
+        tasks.sync_package(dataset["id"], Topic.create, profile)
+
+        benchmark(tasks.sync_package, dataset["id"], Topic.update, profile)
+        assert "package_update" not in remote.calls
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+class TestSyncCommand:
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_foreground(self, benchmark, remote, make_datasets, workers):
+        """Wall time of `ckan syndicate sync -f --force`."""
+        make_datasets(50, 5, 5)
+        profiles = list(utils.get_syndicate_profiles())
+
+        stats = benchmark.pedantic(
+            lambda: bulk.sync_packages(
+                bulk.iter_package_ids(), profiles, workers, force=True
+            ),
+            rounds=3,
+        )
+        assert stats.counters["synced"] == 50
+
+    def test_cli(self, benchmark, remote, make_datasets, cli):
+        from ckan.cli.cli import ckan
+
+        make_datasets(50, 5, 5)
+        result = benchmark.pedantic(
+            cli.invoke,
+            args=(ckan, ["syndicate", "sync", "-f", "--force"]),
+            rounds=3,
+        )
+        assert not result.exit_code, result.output
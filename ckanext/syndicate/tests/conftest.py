@@ -2,6 +2,8 @@ import pytest
 from ckan.tests import factories
 from pytest_factoryboy import register
 
+from ckanext.syndicate import cache, hooks, metrics, utils
+
 
 @register
 class PackageFactory(factories.Dataset):
@@ -11,3 +13,23 @@ class PackageFactory(factories.Dataset):
 @register
 class UserFactory(factories.User):
     pass
+
+
+@pytest.fixture(autouse=True)
+def reset_syndicate_profiles(ckan_config):
+    """Parse profiles using config overrides of the current test."""
+    utils.reset_profiles()
+    cache.reset_caches()
+    metrics.reset()
+    hooks.reset()
+    yield
+    utils.reset_profiles()
+    cache.reset_caches()
+    metrics.reset()
+    hooks.reset()
+
+
+@pytest.fixture
+def clean_db(reset_db, migrate_db_for):
+    reset_db()
+    migrate_db_for("syndicate")
@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import ckan.tests.helpers as helpers
+import ckanapi
+import pytest
+
+from ckanext.syndicate import aio, limits, signals, tasks
+from ckanext.syndicate.model import SyncState
+from ckanext.syndicate.types import Topic
+from ckanext.syndicate.utils import get_syndicate_profiles
+
+httpx = pytest.importorskip("httpx")
+
+
+def _call(handler, action):
+    async def call():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            ckan = aio.AsyncRemoteCKAN(
+                client, "http://example.com", "key", asyncio.Semaphore(1)
+            )
+            return await ckan.call_action(action, {"id": "test"})
+
+    return asyncio.run(call())
+
+
+class TestAsyncRemoteCKAN:
+    def test_result(self):
+        def handler(request):
+            assert request.url.path == "/api/action/package_show"
+            assert request.headers["Authorization"] == "key"
+            assert json.loads(request.content) == {"id": "test"}
+            return httpx.Response(
+                200, json={"success": True, "result": {"id": "test"}}
+            )
+
+        assert _call(handler, "package_show") == {"id": "test"}
+
+    def test_not_found(self):
+        def handler(request):
+            return httpx.Response(
+                404,
+                json={
+                    "success": False,
+                    "error": {"__type": "Not Found Error", "message": ""},
+                },
+            )
+
+        with pytest.raises(ckanapi.NotFound):
+            _call(handler, "package_show")
+
+
+@pytest.fixture
+def ckan(user, app, monkeypatch):
+    ckan = ckanapi.TestAppCKAN(app, user["apikey"])
+    monkeypatch.setattr(tasks, "get_target", lambda *args: ckan)
+    yield ckan
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestMakeJob:
+    def test_new_package(self, user):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+        )
+        profile = next(get_syndicate_profiles())
+        job = aio._make_job(
+            tasks.load_package(dataset["id"]), Topic.update, profile
+        )
+        assert job.action == "package_create"
+        assert job.payload["name"] == "-syndicated_dataset"
+
+    @pytest.mark.usefixtures("clean_redis")
+    def test_up_to_date_package(self, user, ckan):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+        )
+        profile = next(get_syndicate_profiles())
+        tasks.sync_package(dataset["id"], Topic.create, profile)
+
+        job = aio._make_job(
+            tasks.load_package(dataset["id"]), Topic.update, profile
+        )
+        assert job.action == "package_update"
+
+        tasks.sync_package(dataset["id"], Topic.update, profile)
+        job = aio._make_job(
+            tasks.load_package(dataset["id"]), Topic.update, profile
+        )
+        assert not job.action
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis")
+class TestSyndicate:
+    def test_failed_items_do_not_abort_batch(self, package_factory, mocker):
+        broken, valid = package_factory.create_batch(2)
+        profile = next(get_syndicate_profiles())
+        mocker.patch.object(
+            aio, "_make_job", side_effect=[ValueError("broken"), None]
+        )
+        sync = mocker.patch.object(tasks, "sync_package")
+
+        counters, errors = aio.syndicate(
+            [
+                ("missing", Topic.update, profile),
+                (broken["id"], Topic.update, profile),
+                (valid["id"], Topic.update, profile),
+            ]
+        )
+
+        assert counters["failed"] == 2
+        assert counters["synced"] == 1
+        assert len(errors) == 2
+        sync.assert_called_once_with(
+            valid["id"], Topic.update, profile, notified=False
+        )
+
+    def test_fallback_notified_once(self, package, mocker):
+        profile = next(get_syndicate_profiles())
+        job = aio._Job(
+            package["id"], Topic.update, profile, "package_update", {}
+        )
+        mocker.patch.object(aio, "_make_job", return_value=job)
+
+        async def execute(jobs):
+            # e.g. name conflict on the remote portal
+            for job in jobs:
+                job.fallback = True
+
+        mocker.patch.object(aio, "_execute", execute)
+        update = mocker.patch.object(tasks, "_update")
+        receiver = mocker.Mock()
+        signals.before_syndication.connect(receiver)
+        try:
+            counters, _errors = aio.syndicate(
+                [(package["id"], Topic.update, profile)]
+            )
+        finally:
+            signals.before_syndication.disconnect(receiver)
+
+        update.assert_called_once()
+        receiver.assert_called_once()
+        assert counters == {"synced": 1}
+
+    def test_deferred_fallback(self, package, mocker):
+        profile = next(get_syndicate_profiles())
+        mocker.patch.object(aio, "_make_job", return_value=None)
+        mocker.patch.object(
+            tasks,
+            "_update",
+            side_effect=limits.RemoteUnavailable(profile.ckan_url, 30, "test"),
+        )
+
+        counters, errors = aio.syndicate(
+            [(package["id"], Topic.update, profile)]
+        )
+        assert counters == {"deferred": 1}
+        assert not errors
+
+        # unexpected error is moved to the dead-letter store
+        state = SyncState.get(broken["id"], profile.id)
+        assert state.failed_at
+        assert not SyncState.get("missing", profile.id)
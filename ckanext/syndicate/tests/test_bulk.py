@@ -0,0 +1,180 @@
+import datetime
+
+import ckan.model as model
+import pytest
+
+from ckanext.syndicate import bulk
+from ckanext.syndicate.model import SyncState
+from ckanext.syndicate.types import Profile, Topic
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestIterPackageIds:
+    def test_all_packages_are_streamed(self, package_factory):
+        ids = sorted(p["id"] for p in package_factory.create_batch(5))
+        assert list(bulk.iter_package_ids(chunk_size=2)) == ids
+
+    def test_filtered(self, package_factory):
+        pkg = package_factory()
+        package_factory()
+        query = model.Session.query(model.Package.id).filter_by(
+            name=pkg["name"]
+        )
+        assert list(bulk.iter_package_ids(query)) == [pkg["id"]]
+
+
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestEligiblePackages:
+    def test_flag_and_privacy(self, package_factory):
+        from ckan.tests import factories
+
+        organization = factories.Organization()
+        flagged = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        package_factory(
+            owner_org=organization["id"],
+            private=True,
+            extras=[{"key": "syndicate", "value": "1"}],
+        )
+        package_factory()
+
+        ids = [id_ for (id_,) in bulk.eligible_packages_query(Profile("a"))]
+        assert ids == [flagged["id"]]
+
+    def test_predicate(self, package_factory, mocker):
+        first = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        second = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        mocker.patch(
+            "ckanext.syndicate.utils.get_predicate",
+            return_value=lambda pkg: pkg.id == second["id"],
+        )
+
+        ids = bulk.eligible_package_ids(
+            Profile("a"), [first["id"], second["id"]]
+        )
+        assert ids == {second["id"]}
+
+    def test_single_query_per_chunk_and_profile(self, package_factory, mocker):
+        packages = package_factory.create_batch(
+            4, extras=[{"key": "syndicate", "value": "1"}]
+        )
+        spy = mocker.spy(bulk, "eligible_package_ids")
+        profiles = [Profile("a"), Profile("b", flag="other")]
+
+        result = dict(
+            bulk.iter_eligible(
+                [p["id"] for p in packages], profiles, chunk_size=2
+            )
+        )
+        assert spy.call_count == 4
+        assert all(targets == [profiles[0]] for targets in result.values())
+
+    def test_sql_filters_from_plugins(self, package_factory, mocker):
+        pkg = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        package_factory(extras=[{"key": "syndicate", "value": "1"}])
+
+        from ckanext.syndicate.interfaces import ISyndicate
+
+        default = ISyndicate.filter_syndicated_packages
+
+        def filter_syndicated_packages(self, query, profile):
+            query = default(self, query, profile)
+            return query.filter(model.Package.name == pkg["name"])
+
+        mocker.patch(
+            "ckanext.syndicate.plugin.SyndicatePlugin"
+            ".filter_syndicated_packages",
+            filter_syndicated_packages,
+        )
+        ids = [id_ for (id_,) in bulk.eligible_packages_query(Profile("a"))]
+        assert ids == [pkg["id"]]
+
+    def test_skip_syndication_without_sql_filter(
+        self, package_factory, mocker
+    ):
+        excluded = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        # flag is not required by the plugin
+        kept = package_factory()
+
+        def skip_syndication(self, package, profile):
+            return package.id != kept["id"]
+
+        mocker.patch(
+            "ckanext.syndicate.plugin.SyndicatePlugin.skip_syndication",
+            skip_syndication,
+        )
+        profile = Profile("a")
+        ids = [excluded["id"], kept["id"]]
+        assert bulk.eligible_package_ids(profile, ids) == {kept["id"]}
+
+        result = dict(bulk.iter_eligible(ids, [profile]))
+        assert result == {excluded["id"]: [], kept["id"]: [profile]}
+
+
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestChangedPackages:
+    def test_flagged_packages(self, package_factory):
+        flagged = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        package_factory(extras=[{"key": "syndicate", "value": "false"}])
+        package_factory()
+
+        ids = [id_ for (id_,) in bulk.changed_packages_query(Profile("a"))]
+        assert ids == [flagged["id"]]
+
+    def test_custom_flag(self, package_factory):
+        flagged = package_factory(extras=[{"key": "to_hdx", "value": "yes"}])
+        package_factory(extras=[{"key": "syndicate", "value": "yes"}])
+
+        query = bulk.changed_packages_query(Profile("a", flag="to_hdx"))
+        assert [id_ for (id_,) in query] == [flagged["id"]]
+
+    def test_synced_packages(self, package_factory):
+        pkg = package_factory(extras=[{"key": "syndicate", "value": "true"}])
+        profile = Profile("a")
+        state = SyncState.get_or_create(pkg["id"], profile.id)
+        state.touch()
+        model.Session.commit()
+
+        assert not bulk.changed_packages_query(profile).count()
+        assert bulk.changed_packages_query(Profile("b")).count() == 1
+
+        state.last_synced_at -= datetime.timedelta(days=1)
+        model.Session.commit()
+        assert bulk.changed_packages_query(profile).count() == 1
+
+
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestSyncPackages:
+    def test_eligible_packages_synced(self, package_factory, mocker):
+        sync = mocker.patch("ckanext.syndicate.tasks._sync_loaded")
+        flagged = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        package_factory()
+        profile = Profile(id="test")
+
+        stats = bulk.sync_packages(
+            bulk.iter_package_ids(), [profile], workers=2
+        )
+        sync.assert_called_once_with(mocker.ANY, Topic.update, profile)
+        assert sync.call_args[0][0]["id"] == flagged["id"]
+
+        assert stats.packages == 2
+        assert stats.counters["synced"] == 1
+        assert stats.counters["skipped"] == 1
+
+    def test_failures_are_counted(self, package_factory, mocker):
+        mocker.patch(
+            "ckanext.syndicate.tasks._sync_loaded", side_effect=ValueError
+        )
+        package_factory(extras=[{"key": "syndicate", "value": "1"}])
+
+        stats = bulk.sync_packages(bulk.iter_package_ids(), [Profile("test")])
+        assert stats.counters["failed"] == 1
+
+
+def test_rate_limiter(mocker):
+    sleep = mocker.patch("time.sleep")
+    limiter = bulk.RateLimiter(10)
+    limiter.wait()
+    assert not sleep.called
+
+    limiter.wait()
+    assert sleep.call_args[0][0] > 9
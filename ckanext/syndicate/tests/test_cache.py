@@ -0,0 +1,57 @@
+import pytest
+
+from ckanext.syndicate import cache
+
+
+class TestMemoryCache:
+    def test_lru(self):
+        storage = cache.MemoryCache(60, 2)
+        storage.set("a", "1")
+        storage.set("b", "2")
+        assert storage.get("a") == "1"
+
+        storage.set("c", "3")
+        assert storage.get("b") is None
+        assert storage.get("a") == "1"
+        assert storage.get("c") == "3"
+
+    def test_ttl(self, mocker):
+        storage = cache.MemoryCache(60, 10)
+        storage.set("a", "1")
+        mocker.patch("time.monotonic", return_value=10 ** 10)
+        assert storage.get("a") is None
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestRedisCache:
+    def test_get_set_delete(self):
+        storage = cache.RedisCache(60, "test")
+        assert storage.get("a") is None
+        storage.set("a", "1")
+        assert storage.get("a") == "1"
+        storage.delete("a")
+        assert storage.get("a") is None
+
+
+def test_shared_by_default():
+    assert isinstance(cache.get_org_cache(), cache.RedisCache)
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+class TestOrgInvalidation:
+    @pytest.mark.parametrize(
+        "changes", [{"title": "Updated"}, {"name": "renamed"}]
+    )
+    def test_cache_is_reset_on_update(self, changes):
+        from ckan.tests import factories
+        from ckan.tests.helpers import call_action
+
+        from ckanext.syndicate.utils import get_syndicate_profiles
+
+        org = factories.Organization()
+        profile = next(get_syndicate_profiles())
+        key = cache.org_cache_key(profile.id, org["id"])
+        cache.get_org_cache().set(key, "remote-id")
+
+        call_action("organization_patch", id=org["id"], **changes)
+        assert cache.get_org_cache().get(key) is None
@@ -0,0 +1,30 @@
+import ckan.plugins as p
+import pytest
+
+from ckanext.syndicate import hooks
+
+
+@pytest.mark.usefixtures("with_plugins")
+class TestPipeline:
+    def test_resolved_once(self, mocker):
+        lookup = mocker.spy(p, "PluginImplementations")
+        pipeline = hooks.get_pipeline()
+        assert hooks.get_pipeline() is pipeline
+        assert lookup.call_count == 1
+
+        hooks.reset()
+        assert hooks.get_pipeline() is not pipeline
+
+    def test_default_implementation(self):
+        pipeline = hooks.get_pipeline()
+        assert pipeline.skipper is p.get_plugin("syndicate")
+        assert not pipeline.check_each_package
+        # default implementation does not modify package
+        assert pipeline.preparers == ()
+        assert pipeline.before_action is None
+        assert pipeline.after_action is None
+
+    def test_reset_on_configure(self, ckan_config):
+        pipeline = hooks.get_pipeline()
+        p.get_plugin("syndicate").configure(ckan_config)
+        assert hooks.get_pipeline() is not pipeline
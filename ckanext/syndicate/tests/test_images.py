@@ -0,0 +1,91 @@
+import pytest
+import requests
+
+from ckanext.syndicate import images, tasks
+from ckanext.syndicate.types import Profile
+
+URL = "http://example.com/logo.png"
+
+
+@pytest.fixture
+def cache_dir(tmp_path, ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, images.CONFIG_CACHE_DIR, str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def download(mocker):
+    resp = mocker.MagicMock()
+    resp.__enter__.return_value = resp
+    resp.iter_content.return_value = [b"image", b"-content"]
+    return mocker.patch.object(requests, "get", return_value=resp)
+
+
+@pytest.mark.usefixtures("cache_dir")
+class TestFetch:
+    def test_downloaded_once(self, download):
+        path = images.fetch(URL)
+        assert open(path, "rb").read() == b"image-content"
+        assert images.fetch(URL) == path
+        download.assert_called_once()
+
+    def test_same_content_stored_once(self, download, cache_dir):
+        first = images.fetch(URL)
+        second = images.fetch("http://example.com/other.png")
+        assert first == second
+        assert len([p for p in cache_dir.iterdir() if p.is_file()]) == 1
+
+    def test_expired_reference(self, download, ckan_config, monkeypatch):
+        monkeypatch.setitem(ckan_config, images.CONFIG_CACHE_TTL, "-1")
+        images.fetch(URL)
+        images.fetch(URL)
+        assert download.call_count == 2
+
+    def test_too_big(self, download, ckan_config, monkeypatch, cache_dir):
+        monkeypatch.setitem(ckan_config, images.CONFIG_MAX_SIZE, "5")
+        assert images.fetch(URL) is None
+        assert [p for p in cache_dir.iterdir() if p.is_file()] == []
+
+    def test_unavailable(self, download):
+        download.side_effect = requests.ConnectionError
+        assert images.fetch(URL) is None
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_uploaded_image_is_not_downloaded(download, tmp_path, mocker):
+    storage = tmp_path / "group"
+    storage.mkdir()
+    (storage / "logo.png").write_bytes(b"local")
+    upload = mocker.patch.object(images.uploader, "get_uploader")
+    upload.return_value.storage_path = str(storage)
+
+    path, filename = images.get_image(
+        {
+            "image_url": "logo.png",
+            "image_display_url": "http://local/uploads/group/logo.png",
+        }
+    )
+    assert path == str(storage / "logo.png")
+    assert filename == "logo.png"
+    assert not download.called
+
+
+def test_image_uploaded_by_separate_job(mocker):
+    remote = mocker.Mock()
+    remote.action.organization_show.side_effect = tasks.ckanapi.NotFound
+    remote.action.organization_create.return_value = {"id": "remote-org"}
+    mocker.patch.object(tasks, "get_target", return_value=remote)
+    enqueue = mocker.patch.object(tasks.tk, "enqueue_job")
+    download = mocker.patch.object(requests, "get")
+
+    profile = Profile("test")
+    org = {"id": "local-org", "name": "org", "image_url": URL}
+    assert tasks.replicate_remote_organization(org, profile) == "remote-org"
+
+    assert "image_url" not in remote.action.organization_create.call_args[1]
+    assert not download.called
+    enqueue.assert_called_once_with(
+        tasks.sync_organization_image,
+        ["remote-org", {"image_url": URL, "image_display_url": None}, profile],
+        queue=None,
+    )
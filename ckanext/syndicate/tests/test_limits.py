@@ -0,0 +1,141 @@
+import ckanapi
+import pytest
+import requests
+
+from ckanext.syndicate import limits, tasks, utils
+from ckanext.syndicate.model import SyncState
+from ckanext.syndicate.types import Topic
+
+URL = "http://remote.example.com"
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestTokenBucket:
+    def test_unlimited_by_default(self):
+        for _ in range(100):
+            assert limits.reserve(URL) == 0
+
+    @pytest.mark.ckan_config(limits.CONFIG_RATE, "1")
+    @pytest.mark.ckan_config(limits.CONFIG_BURST, "2")
+    def test_burst(self):
+        assert limits.reserve(URL) == 0
+        assert limits.reserve(URL) == 0
+        assert 0 < limits.reserve(URL) <= 1
+
+    @pytest.mark.ckan_config(limits.CONFIG_RATE, "0.1")
+    @pytest.mark.ckan_config(limits.CONFIG_MAX_WAIT, "1")
+    def test_acquire_gives_up(self):
+        limits.acquire(URL)
+        with pytest.raises(limits.RemoteUnavailable):
+            limits.acquire(URL)
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestCircuitBreaker:
+    @pytest.mark.ckan_config(limits.CONFIG_FAILURE_THRESHOLD, "2")
+    def test_open_after_failures(self):
+        limits.record_failure(URL)
+        limits.check_circuit(URL)
+
+        limits.record_failure(URL)
+        with pytest.raises(limits.RemoteUnavailable):
+            limits.check_circuit(URL)
+
+    def test_check_reports_failures(self):
+        assert not limits.check_circuit(URL)
+        limits.record_failure(URL)
+        assert limits.check_circuit(URL)
+        limits.record_success(URL)
+        assert not limits.check_circuit(URL)
+
+    @pytest.mark.ckan_config(limits.CONFIG_FAILURE_THRESHOLD, "2")
+    def test_success_resets_failures(self):
+        limits.record_failure(URL)
+        limits.record_success(URL)
+        limits.record_failure(URL)
+        limits.check_circuit(URL)
+
+    @pytest.mark.ckan_config(limits.CONFIG_FAILURE_THRESHOLD, "1")
+    @pytest.mark.ckan_config(limits.CONFIG_COOLDOWN, "0")
+    def test_single_probe_when_half_open(self):
+        limits.record_failure(URL)
+
+        limits.check_circuit(URL)
+        with pytest.raises(limits.RemoteUnavailable):
+            limits.check_circuit(URL)
+
+        limits.record_success(URL)
+        limits.check_circuit(URL)
+
+    @pytest.mark.parametrize(
+        "error, expected",
+        [
+            (requests.Timeout(), True),
+            (ckanapi.CKANAPIError("502"), True),
+            (ckanapi.NotFound(), False),
+            (ckanapi.ValidationError({}), False),
+        ],
+    )
+    def test_is_failure(self, error, expected):
+        assert limits.is_failure(error) is expected
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+class TestDeferral:
+    def test_sync_is_deferred(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        mocker.patch.object(
+            tasks,
+            "_create",
+            side_effect=limits.RemoteUnavailable(URL, 30, "test"),
+        )
+
+        tasks.sync_package(package["id"], Topic.create, profile)
+
+        state = SyncState.get(package["id"], profile.id)
+        assert state.deferred_topic == Topic.create.name
+        assert state.next_attempt_at
+
+    def test_resume(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        utils.defer_syndication(package["id"], Topic.create, profile, 0)
+        utils.defer_syndication(package["id"], Topic.update, profile, 0)
+        syndicate = mocker.patch.object(utils, "syndicate_dataset")
+
+        assert utils.resume_deferred() == 1
+        syndicate.assert_called_once_with(package["id"], Topic.create, profile)
+        assert utils.resume_deferred() == 0
+        assert not SyncState.get(package["id"], profile.id).next_attempt_at
+
+    def test_kept_when_queue_is_unavailable(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        utils.defer_syndication(package["id"], Topic.create, profile, 0)
+        mocker.patch.object(
+            utils, "syndicate_dataset", side_effect=ConnectionError
+        )
+
+        with pytest.raises(ConnectionError):
+            utils.resume_deferred()
+
+        state = SyncState.get(package["id"], profile.id)
+        assert state.deferred_topic == Topic.create.name
+        assert state.next_attempt_at
+
+    def test_resumed_in_batches(self, package_factory, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        packages = package_factory.create_batch(3)
+        for package in packages:
+            utils.defer_syndication(package["id"], Topic.update, profile, 0)
+        syndicate = mocker.patch.object(utils, "syndicate_dataset")
+
+        assert utils.resume_deferred(batch_size=2) == 3
+        assert {c[0][0] for c in syndicate.call_args_list} == {
+            package["id"] for package in packages
+        }
+
+    def test_future_attempts_are_not_resumed(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        utils.defer_syndication(package["id"], Topic.update, profile, 60)
+        mocker.patch.object(utils, "syndicate_dataset")
+
+        assert utils.resume_deferred() == 0
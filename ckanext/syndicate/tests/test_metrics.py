@@ -0,0 +1,63 @@
+import pytest
+
+from ckanext.syndicate import metrics, tasks, utils
+from ckanext.syndicate.types import Profile, Topic
+
+
+class TestTimer:
+    def test_errors_are_counted(self, mocker):
+        exporter = mocker.Mock()
+        mocker.patch.object(metrics, "get_exporter", return_value=exporter)
+
+        with pytest.raises(ValueError):
+            with metrics.timer("sync", profile="test"):
+                raise ValueError()
+
+        exporter.incr.assert_called_once_with(
+            "sync_errors", 1, {"error": "ValueError", "profile": "test"}
+        )
+        assert exporter.timing.call_args[0][0] == "sync"
+
+
+def test_single_syndication_job_is_instrumented(mocker):
+    exporter = mocker.Mock()
+    mocker.patch.object(metrics, "get_exporter", return_value=exporter)
+    enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+    sync = mocker.patch.object(tasks, "sync_package")
+    profile = Profile("test")
+
+    utils.syndicate_dataset("pkg", Topic.update, profile)
+    job, args = enqueue.call_args[0]
+    job(*args)
+
+    sync.assert_called_once_with("pkg", Topic.update, profile)
+    exporter.timing.assert_called_once_with(
+        "job", mocker.ANY, {"job": "sync_package"}
+    )
+    exporter.flush.assert_called_once()
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestPrometheusExporter:
+    def test_textfile(self, tmp_path):
+        path = tmp_path / "syndicate.prom"
+        exporter = metrics.PrometheusExporter(str(path), "test")
+        exporter.incr("syndicated", 1, {"profile": "a"})
+        exporter.incr("syndicated", 2, {"profile": "a"})
+        exporter.timing("job", 0.5, {"job": "sync"})
+        exporter.flush()
+
+        lines = path.read_text().splitlines()
+        assert 'test_syndicated_total{profile="a"} 3.0' in lines
+        assert 'test_job_seconds_count{job="sync"} 1.0' in lines
+        assert 'test_job_seconds_sum{job="sync"} 0.5' in lines
+
+
+class TestConfig:
+    @pytest.mark.ckan_config(metrics.CONFIG_EXPORTER, "unknown")
+    def test_unknown_exporter(self):
+        from ckan.exceptions import CkanConfigurationException
+
+        metrics.reset()
+        with pytest.raises(CkanConfigurationException):
+            metrics.get_exporter()
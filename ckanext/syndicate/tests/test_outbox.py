@@ -0,0 +1,66 @@
+import ckan.model as model
+import ckan.plugins as p
+import pytest
+from ckan.model.domain_object import DomainObjectOperation
+
+from ckanext.syndicate import outbox
+from ckanext.syndicate.types import Profile, Topic
+
+
+@pytest.fixture
+def syndicate(mocker):
+    yield mocker.patch("ckanext.syndicate.utils.syndicate_package")
+
+
+@pytest.fixture
+def profile(mocker):
+    profile = Profile("test")
+    mocker.patch("ckanext.syndicate.utils.get_profile", return_value=profile)
+    return profile
+
+
+@pytest.mark.ckan_config(outbox.CONFIG_ENABLED, "yes")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestOutbox:
+    def test_notification_recorded(self, package, syndicate):
+        dataset = model.Package.get(package["id"])
+        dataset.extras = {"syndicate": "true"}
+
+        p.get_plugin("syndicate").notify(
+            dataset, DomainObjectOperation.changed
+        )
+        model.Session.commit()
+
+        assert not syndicate.called
+        assert outbox.count() == 1
+
+    def test_entries_merged(self, syndicate, profile):
+        outbox.add("a", Topic.create, [profile])
+        outbox.add("a", Topic.update, [profile])
+        outbox.add("b", Topic.update, [profile])
+        model.Session.commit()
+
+        assert outbox.dispatch() == 3
+        assert syndicate.call_args_list == [
+            (("a", Topic.create, [profile]),),
+            (("b", Topic.update, [profile]),),
+        ]
+        assert outbox.count() == 0
+
+    def test_batches(self, syndicate, profile):
+        for id_ in "abc":
+            outbox.add(id_, Topic.update, [profile])
+        model.Session.commit()
+
+        assert outbox.dispatch(2) == 2
+        assert outbox.dispatch(2) == 1
+        assert outbox.dispatch(2) == 0
+
+    def test_kept_when_queue_is_unavailable(self, syndicate, profile):
+        syndicate.side_effect = ConnectionError
+        outbox.add("a", Topic.update, [profile])
+        model.Session.commit()
+
+        with pytest.raises(ConnectionError):
+            outbox.dispatch()
+        assert outbox.count() == 1
@@ -24,7 +24,7 @@ def dataset_with_flag(dataset):
 
 @pytest.fixture
 def syndicate(mocker):
-    yield mocker.patch("ckanext.syndicate.utils.syndicate_dataset")
+    yield mocker.patch("ckanext.syndicate.utils.syndicate_package")
 
 
 @pytest.mark.usefixtures("clean_db", "with_plugins")
@@ -53,12 +53,22 @@ class TestDatasetNotify:
             dataset_with_flag.id, Topic.update, mocker.ANY
         )
 
-    def test_does_not_syndicate_for_delete(
-        self, syndicate, plugin, dataset_with_flag
+    def test_syndicates_task_for_delete(
+        self, syndicate, plugin, dataset_with_flag, mocker
     ):
-
         plugin.notify(dataset_with_flag, DomainObjectOperation.deleted)
-        assert not (syndicate.called)
+        syndicate.assert_called_with(
+            dataset_with_flag.id, Topic.delete, mocker.ANY
+        )
+
+    def test_syndicates_task_for_soft_delete(
+        self, syndicate, plugin, dataset_with_flag, mocker
+    ):
+        dataset_with_flag.state = model.State.DELETED
+        plugin.notify(dataset_with_flag, DomainObjectOperation.changed)
+        syndicate.assert_called_with(
+            dataset_with_flag.id, Topic.delete, mocker.ANY
+        )
 
 
 @pytest.mark.usefixtures("clean_db", "with_plugins")
@@ -0,0 +1,149 @@
+import datetime
+
+import ckan.model as model
+import pytest
+
+from ckanext.syndicate import reconcile, tasks, utils
+from ckanext.syndicate.model import STATUS_DELETED, STATUS_SYNCED, SyncState
+from ckanext.syndicate.reconcile import Change, LocalState, RemotePackage
+from ckanext.syndicate.types import Profile
+
+SYNCED_AT = datetime.datetime(2020, 1, 1)
+BEFORE = SYNCED_AT - datetime.timedelta(days=1)
+AFTER = SYNCED_AT + datetime.timedelta(days=1)
+
+
+def _local(remote_id, modified=BEFORE, eligible=True, status=STATUS_SYNCED):
+    return LocalState(
+        remote_id,
+        "local-" + remote_id,
+        status,
+        SYNCED_AT,
+        BEFORE,
+        modified,
+        eligible,
+    )
+
+
+class TestMerge:
+    def test_no_drift(self):
+        local = [_local("a"), _local("b")]
+        remote = [RemotePackage("a", BEFORE), RemotePackage("b", None)]
+        assert list(reconcile.merge(local, remote)) == []
+
+    def test_changes(self):
+        local = [
+            _local("a", AFTER),
+            _local("b"),
+            _local("c"),
+            _local("d", eligible=False),
+            _local("f", eligible=False),
+        ]
+        remote = [
+            RemotePackage("a", BEFORE),
+            RemotePackage("b", AFTER),
+            RemotePackage("d", BEFORE),
+            RemotePackage("e", BEFORE),
+        ]
+        assert list(reconcile.merge(local, remote)) == [
+            Change(reconcile.UPDATE, "local-a", "a"),
+            Change(reconcile.UPDATE, "local-b", "b"),
+            Change(reconcile.CREATE, "local-c", "c"),
+            Change(reconcile.DELETE, "local-d", "d"),
+            Change(reconcile.ORPHAN, None, "e"),
+        ]
+
+    def test_remote_clock_is_not_compared_with_local(self):
+        # remote package was modified by our own syndication, after the
+        # sync state was saved, or clock of remote portal is ahead
+        local = [_local("a")._replace(remote_modified=AFTER)]
+        remote = [RemotePackage("a", AFTER)]
+        assert list(reconcile.merge(local, remote)) == []
+
+    def test_remote_time_with_milliseconds(self):
+        recorded = datetime.datetime(2020, 1, 1, 0, 0, 0, 120456)
+        local = [_local("a")._replace(remote_modified=recorded)]
+        modified = utils.parse_date("2020-01-01T00:00:00.12Z")
+        remote = [RemotePackage("a", modified)]
+        assert list(reconcile.merge(local, remote)) == []
+
+    def test_unknown_remote_time(self):
+        local = [_local("a")._replace(remote_modified=None)]
+        remote = [RemotePackage("a", AFTER)]
+        assert list(reconcile.merge(local, remote)) == []
+
+    def test_deleted_remote_restored(self):
+        local = [_local("a", status=STATUS_DELETED)]
+        remote = [RemotePackage("a", BEFORE)]
+        assert list(reconcile.merge(local, remote)) == [
+            Change(reconcile.UPDATE, "local-a", "a"),
+        ]
+
+
+def test_remote_packages_paged(mocker):
+    remote = mocker.Mock()
+    remote.call_action.side_effect = [
+        {"results": [{"id": "a"}, {"id": "b"}]},
+        {"results": [{"id": "c", "metadata_modified": "2020-01-01T00:00:00"}]},
+        {"results": []},
+    ]
+    mocker.patch.object(reconcile.tasks, "get_target", return_value=remote)
+
+    packages = list(reconcile.iter_remote_packages(Profile("test"), 2))
+    assert packages == [
+        RemotePackage("a", None),
+        RemotePackage("b", None),
+        RemotePackage("c", SYNCED_AT),
+    ]
+
+    queries = [c[0][1]["fq"] for c in remote.call_action.call_args_list]
+    assert queries == ["*:*", 'id:{"b" TO *]', 'id:{"c" TO *]']
+
+
+@pytest.mark.usefixtures("clean_db")
+def test_remote_time_refreshed_after_resources(mocker):
+    profile = Profile("test")
+    remote = mocker.Mock()
+    remote.action.package_show.return_value = {
+        "metadata_modified": "2020-01-02T00:00:00.000001"
+    }
+    mocker.patch.object(tasks.resources, "sync", return_value=True)
+
+    tasks.save_sync_state(
+        "local-a",
+        profile,
+        {"id": "a", "name": "a", "metadata_modified": "2020-01-01T00:00:00"},
+    )
+    assert SyncState.get("local-a", profile.id).remote_modified == SYNCED_AT
+
+    tasks._sync_resources({"id": "local-a"}, profile, remote, {"id": "a"})
+    remote.action.package_show.assert_called_once_with(id="a")
+    state = SyncState.get("local-a", profile.id)
+    assert state.remote_modified == datetime.datetime(2020, 1, 2, 0, 0, 0, 1)
+
+
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestLocalStates:
+    def test_sorted_by_remote_id(self, package_factory):
+        profile = Profile("test")
+        flagged = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        other = package_factory()
+
+        for package, remote_id in [(flagged, "b"), (other, "a")]:
+            state = SyncState.get_or_create(package["id"], profile.id)
+            state.remote_id = remote_id
+            state.touch()
+        model.Session.commit()
+
+        states = list(reconcile.iter_local_states(profile, 1))
+        assert [(s.remote_id, s.eligible) for s in states] == [
+            ("a", False),
+            ("b", True),
+        ]
+
+    def test_unsynced_packages(self, package_factory):
+        flagged = package_factory(extras=[{"key": "syndicate", "value": "1"}])
+        package_factory()
+
+        query = reconcile.unsynced_packages_query(Profile("test"))
+        assert [id_ for (id_,) in query] == [flagged["id"]]
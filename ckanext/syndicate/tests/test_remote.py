@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ckanext.syndicate import remote
+
+
+@pytest.fixture(autouse=True)
+def clean_clients():
+    remote.reset_clients()
+    yield
+    remote.reset_clients()
+
+
+class TestGetClient:
+    def test_clients_are_cached(self):
+        client = remote.get_client("http://a.example.com", "key")
+        assert remote.get_client("http://a.example.com", "key") is client
+        assert remote.get_client("http://a.example.com", "other") is not client
+
+    def test_session_is_shared(self):
+        first = remote.get_client("http://a.example.com", "key")
+        second = remote.get_client("http://b.example.com", "key")
+        assert first.session is second.session
+
+    @pytest.mark.ckan_config(remote.CONFIG_POOL_SIZE, "3")
+    @pytest.mark.ckan_config(remote.CONFIG_RETRIES, "5")
+    def test_session_config(self):
+        session = remote.get_client("http://a.example.com", "key").session
+        adapter = session.get_adapter("https://a.example.com")
+        assert adapter._pool_maxsize == 3
+        assert adapter.max_retries.total == 5
+
+
+@pytest.fixture
+def server():
+    requests = []
+    clients = []
+
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            requests.append((dict(self.headers), self.rfile.read(length)))
+            clients.append(self.client_address)
+            body = json.dumps({"success": True, "result": {"id": "res"}})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.requests = requests
+    httpd.clients = clients
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestUpload:
+    def test_streamed_with_content_length(self, server, tmp_path):
+        content = b"a,b\n" * 100000
+        path = tmp_path / "data.csv"
+        path.write_bytes(content)
+        url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+        client = remote.get_client(url, "key")
+        result, file_hash = client.upload(
+            "resource_create", {"package_id": "pkg"}, str(path), "data.csv"
+        )
+
+        assert result == {"id": "res"}
+        assert file_hash == hashlib.sha256(content).hexdigest()
+
+        headers, body = server.requests[0]
+        assert "Transfer-Encoding" not in headers
+        assert int(headers["Content-Length"]) == len(body)
+        assert headers["Authorization"] == "key"
+
+        boundary = headers["Content-Type"].split("boundary=")[1]
+        assert body.startswith(f"--{boundary}\r\n".encode())
+        assert body.endswith(f"\r\n--{boundary}--\r\n".encode())
+        assert b'name="package_id"\r\n\r\npkg\r\n' in body
+        assert b'name="upload"; filename="data.csv"' in body
+        assert content in body
+
+    def test_stream_length(self, tmp_path):
+        path = tmp_path / "data.csv"
+        path.write_bytes(b"x" * 1000)
+
+        with remote.MultipartStream({"a": 1}, "upload", "f", str(path)) as s:
+            assert s.tell() == 0
+            size = len(s)
+            body = s.read(100)
+            assert s.tell() == 100
+            body += s.read()
+            assert s.tell() == size == len(body)
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestCallAction:
+    def test_connection_reused(self, server):
+        url = "http://127.0.0.1:{}".format(server.server_address[1])
+        client = remote.get_client(url, "key")
+        for _ in range(3):
+            result = client.call_action("package_show", {"id": "a"})
+            assert result == {"id": "res"}
+        assert len(server.clients) == 3
+        assert len(set(server.clients)) == 1
+
+    def test_failures_reset_only_when_recorded(self, server, mocker):
+        url = "http://127.0.0.1:{}".format(server.server_address[1])
+        client = remote.get_client(url, "key")
+        reset = mocker.spy(remote.limits, "record_success")
+
+        client.call_action("package_show", {"id": "a"})
+        assert not reset.called
+
+        remote.limits.record_failure(url)
+        client.call_action("package_show", {"id": "a"})
+        reset.assert_called_once_with(url)
@@ -0,0 +1,199 @@
+import hashlib
+
+import pytest
+
+from ckanext.syndicate import resources
+from ckanext.syndicate.model import ResourceState
+from ckanext.syndicate.types import Profile
+
+PROFILE = Profile("test", upload_files=True)
+
+
+@pytest.fixture
+def local_file(tmp_path, mocker):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n")
+    mocker.patch.object(resources, "_get_path", return_value=str(path))
+    return path
+
+
+@pytest.fixture
+def remote():
+    class Remote:
+        def __init__(self):
+            self.calls = []
+
+        def upload(self, action, data, path, filename):
+            self.calls.append((action, data))
+            with open(path, "rb") as src:
+                content = src.read()
+            return (
+                {"id": "remote-res", "url": "http://remote/" + filename},
+                hashlib.sha256(content).hexdigest(),
+            )
+
+    return Remote()
+
+
+def _package():
+    return {
+        "id": "local-pkg",
+        "resources": [
+            {
+                "id": "local-res",
+                "name": "Data",
+                "url": "http://local/download/data.csv",
+                "url_type": "upload",
+            },
+            {"id": "link", "name": "Link", "url": "http://example.com"},
+        ],
+    }
+
+
+def test_links_without_uploads():
+    package = _package()
+    result = resources.prepare("local-pkg", package["resources"], Profile("a"))
+    assert result == [
+        {"url": "http://local/download/data.csv", "name": "Data"},
+        {"url": "http://example.com", "name": "Link"},
+    ]
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestUploads:
+    def test_new_upload_created_after_package(self, local_file, remote):
+        package = _package()
+        prepared = resources.prepare(
+            "local-pkg", package["resources"], PROFILE
+        )
+        assert prepared == [{"url": "http://example.com", "name": "Link"}]
+
+        resources.sync(package, PROFILE, remote, {"id": "remote-pkg"})
+        assert remote.calls == [
+            (
+                "resource_create",
+                {
+                    "name": "Data",
+                    "url": "data.csv",
+                    "package_id": "remote-pkg",
+                },
+            )
+        ]
+
+        state = ResourceState.for_package("local-pkg", PROFILE.id)["local-res"]
+        assert state.remote_id == "remote-res"
+        assert state.size == local_file.stat().st_size
+
+        prepared = resources.prepare(
+            "local-pkg", package["resources"], PROFILE
+        )
+        assert prepared[0]["id"] == "remote-res"
+
+    def test_unchanged_file_is_skipped(self, local_file, remote):
+        package = _package()
+        remote_package = {
+            "id": "remote-pkg",
+            "resources": [{"id": "remote-res"}],
+        }
+        resources.sync(package, PROFILE, remote, remote_package)
+        resources.sync(package, PROFILE, remote, remote_package)
+        assert len(remote.calls) == 1
+
+        local_file.write_text("a,b\n3,4\n")
+        resources.sync(package, PROFILE, remote, remote_package)
+        assert [action for action, _ in remote.calls] == [
+            "resource_create",
+            "resource_update",
+        ]
+
+    def test_removed_remote_resource_is_recreated(self, local_file, remote):
+        package = _package()
+        resources.sync(package, PROFILE, remote, {"id": "remote-pkg"})
+        resources.sync(package, PROFILE, remote, {"id": "remote-pkg"})
+        assert [action for action, _ in remote.calls] == [
+            "resource_create",
+            "resource_create",
+        ]
+
+
+DIFF_PROFILE = Profile("test", resource_diff=True)
+
+
+@pytest.fixture
+def diff_remote(mocker):
+    ckan = mocker.Mock()
+    ckan.action.resource_create.side_effect = lambda **data: dict(
+        data, id="remote-" + data["name"]
+    )
+    ckan.action.resource_patch.side_effect = lambda **data: data
+    return ckan
+
+
+def _remote_package(package):
+    return {
+        "id": "remote-pkg",
+        "resources": [
+            dict(res, id="remote-" + res["name"])
+            for res in package["resources"]
+        ],
+    }
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestDiff:
+    def test_resources_are_not_sent_with_package(self):
+        package = _package()
+        assert (
+            resources.prepare("local-pkg", package["resources"], DIFF_PROFILE)
+            is None
+        )
+
+    def test_only_changes_are_sent(self, diff_remote):
+        package = _package()
+        assert resources.sync(
+            package, DIFF_PROFILE, diff_remote, {"id": "remote-pkg"}
+        )
+        assert diff_remote.action.resource_create.call_count == 2
+
+        remote_package = _remote_package(package)
+        diff_remote.reset_mock()
+        assert not resources.sync(
+            package, DIFF_PROFILE, diff_remote, remote_package
+        )
+        assert not diff_remote.method_calls
+
+        package["resources"][1]["url"] = "http://example.com/new"
+        resources.sync(package, DIFF_PROFILE, diff_remote, remote_package)
+        diff_remote.action.resource_patch.assert_called_once_with(
+            id="remote-Link", url="http://example.com/new", name="Link"
+        )
+        assert not diff_remote.action.resource_create.called
+
+    def test_removed_resources(self, diff_remote):
+        package = _package()
+        remote_package = _remote_package(package)
+        resources.sync(package, DIFF_PROFILE, diff_remote, remote_package)
+
+        package["resources"].pop()
+        resources.sync(package, DIFF_PROFILE, diff_remote, remote_package)
+        diff_remote.action.resource_delete.assert_called_once_with(
+            id="remote-Link"
+        )
+        assert set(
+            ResourceState.for_package("local-pkg", DIFF_PROFILE.id)
+        ) == {"local-res"}
+
+    def test_identical_remote_resources_are_adopted(self, diff_remote):
+        package = _package()
+        remote_package = {
+            "id": "remote-pkg",
+            "resources": [
+                {"id": "existing", "url": "http://example.com", "name": "Link"}
+            ],
+        }
+        resources.sync(package, DIFF_PROFILE, diff_remote, remote_package)
+
+        diff_remote.action.resource_create.assert_called_once()
+        assert not diff_remote.action.resource_delete.called
+        state = ResourceState.for_package("local-pkg", DIFF_PROFILE.id)
+        assert state["link"].remote_id == "existing"
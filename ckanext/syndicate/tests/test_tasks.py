@@ -5,10 +5,9 @@ import ckan.tests.helpers as helpers
 import ckanapi
 import mock
 import pytest
-from ckan.lib.helpers import get_pkg_dict_extra
 
 from ckanext.syndicate.types import Topic
-from ckanext.syndicate.utils import get_syndicate_profiles
+from ckanext.syndicate.utils import get_syndicate_profiles, reset_profiles
 
 
 def _get_context(context):
@@ -22,10 +21,17 @@ def _get_context(context):
     }
 
 
-from ckanext.syndicate import tasks
+from ckanext.syndicate import tasks, utils
+from ckanext.syndicate.model import SyncState
 from ckanext.syndicate.tasks import sync_package
 
 
+def _get_syndicated_id(package_id):
+    profile = next(get_syndicate_profiles())
+    state = SyncState.get(package_id, profile.id)
+    return state.remote_id if state else None
+
+
 @pytest.fixture
 def ckan(user, app, monkeypatch):
     ckan = ckanapi.TestAppCKAN(app, user["apikey"])
@@ -76,7 +82,7 @@ class TestSyncTask(object):
 
         # The source package should have a syndicated_id set pointing to the
         # new syndicated package.
-        syndicated_id = get_pkg_dict_extra(source, "syndicated_id")
+        syndicated_id = _get_syndicated_id(source["id"])
         assert syndicated_id is not None
 
         # Expect a new package to be created
@@ -161,6 +167,169 @@ class TestSyncTask(object):
         local_resource_url = local_resource["url"]
         assert local_resource_url == remote_resource_url
 
+    @pytest.mark.usefixtures("clean_redis")
+    def test_unchanged_package_is_not_updated(self, user, ckan, mocker):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+            extras=[{"key": "syndicate", "value": "true"}],
+        )
+        profile = next(get_syndicate_profiles())
+
+        sync_package(dataset["id"], Topic.create, profile)
+        sync_package(dataset["id"], Topic.update, profile)
+        assert utils.get_skipped_writes() == {}
+
+        remote_call = mocker.spy(ckan, "call_action")
+        sync_package(dataset["id"], Topic.update, profile)
+        assert utils.get_skipped_writes() == {profile.id: 1}
+        # remote package is not even read
+        assert not remote_call.called
+
+        helpers.call_action("package_patch", id=dataset["id"], notes="Changed")
+        sync_package(dataset["id"], Topic.update, profile)
+        assert utils.get_skipped_writes() == {profile.id: 1}
+        assert remote_call.called
+
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.second.ckan_url", "http://example.com"
+    )
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.second.name_prefix", "second"
+    )
+    def test_package_loaded_once_for_all_profiles(self, user, ckan, mocker):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+        )
+        load = mocker.spy(tasks, "load_package")
+        profiles = list(get_syndicate_profiles())
+        assert len(profiles) == 2
+
+        tasks.sync_package_profiles(dataset["id"], Topic.create, profiles)
+        load.assert_called_once()
+
+        for profile in profiles:
+            state = SyncState.get(dataset["id"], profile.id)
+            assert helpers.call_action("package_show", id=state.remote_id)
+
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.lean.ckan_url", "http://example.com"
+    )
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.lean.fields", "title notes extras"
+    )
+    def test_lean_package(self, user, create_with_upload):
+        org = factories.Organization()
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+            title="Syndicated",
+            owner_org=org["id"],
+            extras=[{"key": "syndicate", "value": "true"}],
+        )
+        create_with_upload("test", "test_file.txt", package_id=dataset["id"])
+        full = tasks.load_package(dataset["id"])
+
+        profile = utils.get_profile("lean")
+        fields = tasks.get_snapshot_fields([profile])
+        lean = tasks.load_package(dataset["id"], fields)
+
+        for field in ["id", "name", "title", "notes", "owner_org"]:
+            assert lean[field] == full[field]
+        assert {e["key"]: e["value"] for e in lean["extras"]} == {
+            e["key"]: e["value"] for e in full["extras"]
+        }
+        assert "author" not in lean
+        assert lean["organization"]["name"] == org["name"]
+        assert lean["resources"] == [
+            {
+                "id": r["id"],
+                "url": r["url"],
+                "url_type": r["url_type"],
+                "name": r["name"],
+            }
+            for r in full["resources"]
+        ]
+
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.lean.ckan_url", "http://example.com"
+    )
+    @pytest.mark.ckan_config("ckanext.syndicate.profile.lean.fields", "title")
+    def test_lean_package_with_legacy_id(self, user):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+            extras=[
+                {"key": "syndicate", "value": "true"},
+                {"key": "syndicated_id", "value": "remote-id"},
+                {"key": "other", "value": "value"},
+            ],
+        )
+        profile = utils.get_profile("lean")
+        lean = tasks.load_package(
+            dataset["id"], tasks.get_snapshot_fields([profile])
+        )
+
+        assert {e["key"] for e in lean["extras"]} == {
+            "syndicate",
+            "syndicated_id",
+        }
+        assert tasks.get_syndicated_id(lean, profile) == "remote-id"
+        # extras are not listed by the profile
+        payload = tasks._prepare_payload(dataset["id"], lean, profile)
+        assert payload["extras"] == []
+
+    def test_delete_package(self, user, ckan):
+        dataset = helpers.call_action(
+            "package_create",
+            context={"user": user["name"]},
+            name="syndicated_dataset",
+            extras=[{"key": "syndicate", "value": "true"}],
+        )
+        profile = next(get_syndicate_profiles())
+        sync_package(dataset["id"], Topic.create, profile)
+        syndicated_id = _get_syndicated_id(dataset["id"])
+
+        helpers.call_action("package_delete", id=dataset["id"])
+        sync_package(dataset["id"], Topic.delete, profile)
+
+        syndicated = helpers.call_action("package_show", id=syndicated_id)
+        assert syndicated["state"] == "deleted"
+        assert SyncState.get(dataset["id"], profile.id).status == "deleted"
+
+    @pytest.mark.usefixtures("clean_redis")
+    def test_deletions_are_batched(self, user, ckan, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(get_syndicate_profiles())
+        ids = []
+        for idx in range(3):
+            dataset = helpers.call_action(
+                "package_create",
+                context={"user": user["name"]},
+                name=f"syndicated_dataset_{idx}",
+                extras=[{"key": "syndicate", "value": "true"}],
+            )
+            sync_package(dataset["id"], Topic.create, profile)
+            ids.append(dataset["id"])
+
+        for id_ in ids:
+            utils.syndicate_dataset(id_, Topic.delete, profile)
+        enqueue.assert_called_once_with(
+            tasks.delete_packages, [profile], queue=None
+        )
+
+        tasks.delete_packages(profile)
+        for id_ in ids:
+            syndicated = helpers.call_action(
+                "package_show", id=_get_syndicated_id(id_)
+            )
+            assert syndicated["state"] == "deleted"
+
     def test_syndicate_existing_package(self, user, ckan):
         context = {
             "user": user["name"],
@@ -194,7 +363,7 @@ class TestSyncTask(object):
             id=existing["id"],
         )
 
-        syndicated_id = get_pkg_dict_extra(updated, "syndicated_id")
+        syndicated_id = _get_syndicated_id(updated["id"])
 
         syndicated = helpers.call_action(
             "package_show",
@@ -240,7 +409,7 @@ class TestSyncTask(object):
             id=existing["id"],
         )
 
-        syndicated_id = get_pkg_dict_extra(updated, "syndicated_id")
+        syndicated_id = _get_syndicated_id(updated["id"])
 
         syndicated = helpers.call_action(
             "package_show",
@@ -293,6 +462,7 @@ class TestSyncTask(object):
     @pytest.mark.ckan_config("ckan.syndicate.name_prefix", "test")
     def test_author_check(self, user, ckan, monkeypatch, ckan_config):
         monkeypatch.setitem(ckan_config, "ckan.syndicate.author", user["name"])
+        reset_profiles()
 
         context = {"user": user["name"]}
         dataset1 = helpers.call_action(
@@ -318,4 +488,4 @@ class TestSyncTask(object):
         sync_package(dataset1["id"], Topic.update, profile)
         mock_user_show.assert_called_once_with(id=user["name"])
         updated1 = helpers.call_action("package_show", id=dataset1["id"])
-        assert get_pkg_dict_extra(updated1, "syndicated_id") is not None
+        assert _get_syndicated_id(updated1["id"]) is not None
@@ -0,0 +1,268 @@
+import time
+
+import pytest
+import requests
+from ckan.exceptions import CkanConfigurationException
+from ckan.lib.redis import connect_to_redis
+
+from ckanext.syndicate import tasks, utils
+from ckanext.syndicate.model import SyncState
+from ckanext.syndicate.types import Topic
+
+
+class TestProfiles:
+    @pytest.mark.ckan_config("ckanext.syndicate.profile.first.ckan_url", "a")
+    @pytest.mark.ckan_config("ckanext.syndicate.profile.second.ckan_url", "b")
+    def test_profiles_are_cached(self, mocker):
+        parse = mocker.spy(utils, "syndicate_configs_from_config")
+        profiles = list(utils.get_syndicate_profiles())
+        assert list(utils.get_syndicate_profiles()) == profiles
+        assert parse.call_count == 1
+
+        # legacy profile from test.ini goes first
+        assert [p.id for p in profiles] == ["0", "first", "second"]
+
+    @pytest.mark.ckan_config("ckanext.syndicate.profile.first.ckan_url", "a")
+    def test_get_profile(self):
+        assert utils.get_profile("first").ckan_url == "a"
+        assert utils.get_profile("not-exists") is None
+
+    def test_reset_profiles(self, ckan_config, monkeypatch):
+        assert utils.get_profile("new") is None
+        monkeypatch.setitem(
+            ckan_config, "ckanext.syndicate.profile.new.ckan_url", "a"
+        )
+        assert utils.get_profile("new") is None
+
+        utils.reset_profiles()
+        assert utils.get_profile("new").ckan_url == "a"
+
+
+class TestPredicates:
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.first.predicate",
+        "ckanext.syndicate.helpers.organization_owns_dataset",
+    )
+    def test_predicate_imported_once(self):
+        from ckanext.syndicate.helpers import organization_owns_dataset
+
+        profile = utils.get_profile("first")
+        assert utils.get_predicate(profile) is organization_owns_dataset
+
+    @pytest.mark.ckan_config(
+        "ckanext.syndicate.profile.first.predicate",
+        "ckanext.syndicate.helpers.not_a_predicate",
+    )
+    def test_broken_predicate(self):
+        with pytest.raises(CkanConfigurationException):
+            utils.reload_profiles()
+
+    def test_no_predicate(self):
+        profile = next(utils.get_syndicate_profiles())
+        assert utils.get_predicate(profile) is None
+
+
+@pytest.mark.usefixtures("clean_redis")
+class TestDebounce:
+    @pytest.mark.ckan_config(utils.CONFIG_DEBOUNCE_WINDOW, "60")
+    def test_changes_are_coalesced(self, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(utils.get_syndicate_profiles())
+
+        utils.syndicate_dataset("pkg", Topic.create, profile)
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        enqueue.assert_called_once()
+
+        assert utils.pop_pending("pkg", profile) is Topic.create
+        assert utils.pop_pending("pkg", profile) is None
+
+    @pytest.mark.ckan_config(utils.CONFIG_DEBOUNCE_WINDOW, "60")
+    def test_new_job_after_pop(self, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(utils.get_syndicate_profiles())
+
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        utils.pop_pending("pkg", profile)
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        assert enqueue.call_count == 2
+
+    @pytest.mark.ckan_config(utils.CONFIG_DEBOUNCE_WINDOW, "60")
+    def test_pop_during_update(self, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        assert utils.add_pending("pkg", Topic.create, profile)
+
+        parsed = []
+        parse = utils._parse_pending
+
+        def pop_concurrently(value):
+            parsed.append(value)
+            if len(parsed) == 1:
+                # worker takes the record before it's updated
+                utils.pop_pending("pkg", profile)
+            return parse(value)
+
+        mocker.patch.object(
+            utils, "_parse_pending", side_effect=pop_concurrently
+        )
+        assert utils.add_pending("pkg", Topic.update, profile)
+        assert utils.pop_pending("pkg", profile) is Topic.update
+
+    def test_lost_delete_job(self, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(utils.get_syndicate_profiles())
+
+        utils.syndicate_dataset("a", Topic.delete, profile)
+        utils.syndicate_dataset("b", Topic.delete, profile)
+        assert enqueue.call_count == 1
+
+        # job was lost and batch is not processed for too long
+        started = int(time.time()) - utils.PENDING_DELETE_TIMEOUT
+        connect_to_redis().set(
+            utils._pending_delete_started_key(profile), started
+        )
+        utils.syndicate_dataset("c", Topic.delete, profile)
+        assert enqueue.call_count == 2
+        utils.syndicate_dataset("d", Topic.delete, profile)
+        assert enqueue.call_count == 2
+
+        assert sorted(utils.pop_pending_deletes(profile)) == list("abcd")
+        utils.syndicate_dataset("e", Topic.delete, profile)
+        assert enqueue.call_count == 3
+
+    def test_disabled(self, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(utils.get_syndicate_profiles())
+
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        utils.syndicate_dataset("pkg", Topic.update, profile)
+        assert enqueue.call_count == 2
+
+
+class TestQueues:
+    def test_default_queue(self):
+        profile = next(utils.get_syndicate_profiles())
+        assert utils.get_queue(profile) is None
+
+    @pytest.mark.ckan_config(utils.CONFIG_QUEUE, "syndicate")
+    def test_global_queue(self):
+        profile = next(utils.get_syndicate_profiles())
+        assert utils.get_queue(profile) == "syndicate"
+
+    @pytest.mark.ckan_config(utils.CONFIG_QUEUE, "syndicate")
+    @pytest.mark.ckan_config(utils.CONFIG_BULK_QUEUE_SUFFIX, "bulk")
+    def test_bulk_lane(self):
+        profile = next(utils.get_syndicate_profiles())
+        with utils.bulk_lane():
+            assert utils.get_queue(profile) == "syndicate-bulk"
+            assert utils.get_queue(profile._replace(queue="hdx")) == "hdx-bulk"
+        assert utils.get_queue(profile) == "syndicate"
+
+    def test_bulk_lane_disabled_by_default(self):
+        profile = next(utils.get_syndicate_profiles())
+        with utils.bulk_lane():
+            assert utils.get_queue(profile) is None
+
+    def test_profiles_are_grouped_by_queue(self, mocker):
+        enqueue = mocker.patch("ckan.plugins.toolkit.enqueue_job")
+        profile = next(utils.get_syndicate_profiles())
+        fast = profile._replace(id="fast", queue="fast")
+        slow = profile._replace(id="slow", queue="slow")
+        other = profile._replace(id="other", queue="slow")
+
+        utils.syndicate_package("pkg", Topic.update, [fast, slow, other])
+
+        queues = {
+            call.kwargs["queue"]: call.args[1][2]
+            for call in enqueue.call_args_list
+        }
+        assert queues == {"fast": [fast], "slow": [slow, other]}
+
+
+@pytest.mark.usefixtures("clean_db", "clean_redis", "with_plugins")
+class TestRetries:
+    @pytest.fixture
+    def fail(self, mocker):
+        return mocker.patch.object(
+            tasks, "_create", side_effect=requests.ConnectionError("down")
+        )
+
+    def test_transient_error_is_retried(self, package, fail):
+        profile = next(utils.get_syndicate_profiles())
+        with pytest.raises(requests.ConnectionError):
+            tasks.sync_package(package["id"], Topic.create, profile)
+
+        state = SyncState.get(package["id"], profile.id)
+        assert state.attempts == 1
+        assert state.deferred_topic == Topic.create.name
+        assert state.next_attempt_at
+        assert state.last_error == "ConnectionError: down"
+        assert not state.failed_at
+
+    @pytest.mark.ckan_config(utils.CONFIG_RETRY_MAX_ATTEMPTS, "1")
+    def test_dead_letter_after_retries(self, package, fail):
+        profile = next(utils.get_syndicate_profiles())
+        for _ in range(2):
+            with pytest.raises(requests.ConnectionError):
+                tasks.sync_package(package["id"], Topic.update, profile)
+
+        state = SyncState.get(package["id"], profile.id)
+        assert state.failed_at
+        assert not state.next_attempt_at
+
+    def test_permanent_error_is_not_retried(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        mocker.patch.object(tasks, "_create", side_effect=ValueError)
+        with pytest.raises(ValueError):
+            tasks.sync_package(package["id"], Topic.create, profile)
+
+        assert SyncState.get(package["id"], profile.id).failed_at
+
+    def test_replay(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        utils.retry_syndication(
+            package["id"], Topic.create, profile, ValueError(), False
+        )
+        syndicate = mocker.patch.object(utils, "syndicate_dataset")
+
+        query = utils.failed_syndications_query(error="KeyError")
+        assert utils.replay_failed(query) == 0
+
+        query = utils.failed_syndications_query([package["id"]])
+        assert utils.replay_failed(query) == 1
+        syndicate.assert_called_once_with(package["id"], Topic.create, profile)
+        assert not query.count()
+
+    def test_kept_when_replay_fails(self, package, mocker):
+        profile = next(utils.get_syndicate_profiles())
+        utils.retry_syndication(
+            package["id"], Topic.create, profile, ValueError(), False
+        )
+        mocker.patch.object(
+            utils, "syndicate_dataset", side_effect=ConnectionError
+        )
+
+        query = utils.failed_syndications_query([package["id"]])
+        with pytest.raises(ConnectionError):
+            utils.replay_failed(query)
+
+        state = query.one()
+        assert state.deferred_topic == Topic.create.name
+        assert state.attempts == 1
+
+    def test_success_resets_attempts(self, package):
+        profile = next(utils.get_syndicate_profiles())
+        utils.retry_syndication(
+            package["id"], Topic.update, profile, ValueError()
+        )
+        state = SyncState.get(package["id"], profile.id)
+        state.touch()
+        assert state.attempts == 0
+        assert not state.last_error
+
+
+def test_retry_delay_grows(ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, utils.CONFIG_RETRY_MAX_DELAY, "100")
+    assert 15 <= utils.get_retry_delay(1) <= 30
+    assert 30 <= utils.get_retry_delay(2) <= 60
+    assert 50 <= utils.get_retry_delay(10) <= 100
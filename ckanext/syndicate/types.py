@@ -7,6 +7,7 @@ from typing import Any, NamedTuple
 class Topic(enum.Enum):
     create = enum.auto()
     update = enum.auto()
+    delete = enum.auto()
     unknown = enum.auto()
 
 
@@ -20,6 +21,11 @@ class Profile(NamedTuple):
     name_prefix: str = ""
     replicate_organization: bool = False
     author: str = ""
+    purge: bool = False
+    fields: str = ""
+    queue: str = ""
+    upload_files: bool = False
+    resource_diff: bool = False
 
     predicate: str = ""
     extras: dict[str, Any] = {}
@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import contextlib
+import contextvars
+import datetime
+import hashlib
 import json
 import logging
+import random
+import time
 import warnings
 from collections import defaultdict
 from itertools import zip_longest
-from typing import Iterable, Iterator, Type
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Type,
+)
 
 import ckan.model as ckan_model
 import ckan.plugins.toolkit as tk
+import sqlalchemy as sa
+from ckan.exceptions import CkanConfigurationException
+from ckan.lib.jobs import DEFAULT_QUEUE_NAME
+from ckan.lib.redis import connect_to_redis
 from ckan.plugins import get_plugin
+from werkzeug.utils import import_string
 
+from .model import SyncState
 from .types import Profile, Topic
 
 CkanDeprecationWarning: Type
@@ -27,23 +47,287 @@ class SyndicationDeprecationWarning(CkanDeprecationWarning):
 
 
 PROFILE_PREFIX = "ckanext.syndicate.profile."
+CONFIG_DEBOUNCE_WINDOW = "ckanext.syndicate.debounce_window"
+CONFIG_QUEUE = "ckanext.syndicate.queue"
+CONFIG_BULK_QUEUE_SUFFIX = "ckanext.syndicate.bulk_queue_suffix"
+CONFIG_RETRY_MAX_ATTEMPTS = "ckanext.syndicate.retry.max_attempts"
+CONFIG_RETRY_BASE_DELAY = "ckanext.syndicate.retry.base_delay"
+CONFIG_RETRY_MAX_DELAY = "ckanext.syndicate.retry.max_delay"
+
+DEFAULT_RETRY_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_DELAY = 30
+DEFAULT_RETRY_MAX_DELAY = 60 * 60
+
+# failure reasons are not supposed to contain complete responses
+MAX_ERROR_LENGTH = 2000
+
+# pending topics live much longer than debounce window, so that they are not
+# lost while job waits in the queue
+PENDING_TTL = 24 * 60 * 60
+# batch of deletions is considered lost after this number of seconds, when
+# debouncing is disabled
+PENDING_DELETE_TIMEOUT = 5 * 60
+# number of sync states loaded at once by resume/replay
+STATE_BATCH_SIZE = 500
+
 log = logging.getLogger(__name__)
 
+_bulk: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "syndicate_bulk", default=False
+)
+
 
 def deprecated(msg):
     log.warning(msg)
     warnings.warn(msg, category=SyndicationDeprecationWarning, stacklevel=3)
 
 
+@contextlib.contextmanager
+def bulk_lane():
+    """Send syndication jobs enqueued inside the block to bulk queues."""
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+def get_queue(profile: Profile) -> Optional[str]:
+    """Name of the queue for syndication jobs of the profile.
+
+    `None` means default CKAN queue.
+
+    """
+    queue = profile.queue or tk.config.get(CONFIG_QUEUE) or None
+    suffix = tk.config.get(CONFIG_BULK_QUEUE_SUFFIX)
+    if suffix and _bulk.get():
+        queue = "{}-{}".format(queue or DEFAULT_QUEUE_NAME, suffix)
+    return queue
+
+
+def _group_by_queue(
+    items: Iterable[Any], profile: Callable[[Any], Profile]
+) -> Iterable[tuple[Optional[str], list[Any]]]:
+    groups: dict[Optional[str], list[Any]] = defaultdict(list)
+    for item in items:
+        groups[get_queue(profile(item))].append(item)
+    return groups.items()
+
+
 def syndicate_dataset(package_id: str, topic: Topic, profile: Profile):
     import ckanext.syndicate.tasks as tasks
 
+    queue = get_queue(profile)
+    if topic is Topic.delete:
+        # deletions are cheap, so they are processed in batches
+        if add_pending_delete(package_id, profile):
+            tk.enqueue_job(tasks.delete_packages, [profile], queue=queue)
+        return
+
+    if get_debounce_window() > 0:
+        if not add_pending(package_id, topic, profile):
+            log.debug(
+                "Syndication of %s for profile %s is already scheduled",
+                package_id,
+                profile.id,
+            )
+            return
+
+        tk.enqueue_job(
+            tasks.sync_pending_package,
+            [package_id, topic, profile],
+            queue=queue,
+        )
+        return
+
     tk.enqueue_job(
-        tasks.sync_package,
+        tasks.sync_package_job,
         [package_id, topic, profile],
+        queue=queue,
     )
 
 
+def syndicate_package(
+    package_id: str, topic: Topic, profiles: Iterable[Profile]
+):
+    """Enqueue syndication of the package to multiple profiles.
+
+    Package is loaded only once by the job and then sent to every profile
+    that uses the same queue.
+
+    """
+    import ckanext.syndicate.aio as aio
+    import ckanext.syndicate.tasks as tasks
+
+    profiles = list(profiles)
+    if aio.is_enabled():
+        syndicate_batch([(package_id, topic, profile) for profile in profiles])
+        return
+
+    if topic is Topic.delete:
+        for profile in profiles:
+            syndicate_dataset(package_id, topic, profile)
+        return
+
+    pending = get_debounce_window() > 0
+    if pending:
+        profiles = [p for p in profiles if add_pending(package_id, topic, p)]
+
+    for queue, group in _group_by_queue(profiles, lambda p: p):
+        tk.enqueue_job(
+            tasks.sync_package_profiles,
+            [package_id, topic, group, pending],
+            queue=queue,
+        )
+
+
+def syndicate_batch(items: list[tuple[str, Topic, Profile]]):
+    """Enqueue single job that syndicates all the items concurrently."""
+    import ckanext.syndicate.aio as aio
+
+    batch = []
+    for package_id, topic, profile in items:
+        if topic is Topic.delete:
+            syndicate_dataset(package_id, topic, profile)
+        else:
+            batch.append((package_id, topic, profile))
+
+    pending = get_debounce_window() > 0
+    if pending:
+        batch = [item for item in batch if add_pending(*item)]
+
+    for queue, group in _group_by_queue(batch, lambda item: item[2]):
+        tk.enqueue_job(aio.sync_batch, [group, pending], queue=queue)
+
+
+def get_debounce_window() -> int:
+    return tk.asint(tk.config.get(CONFIG_DEBOUNCE_WINDOW, 0))
+
+
+def redis_key(*parts: str) -> str:
+    site_id = tk.config.get("ckan.site_id", "")
+    return ":".join(("ckanext-syndicate", site_id) + parts)
+
+
+def _pending_key(package_id: str) -> str:
+    return redis_key("pending", package_id)
+
+
+def merge_topics(old: Topic, new: Topic) -> Topic:
+    """Combine two consecutive topics into one."""
+    if old is Topic.create and new is Topic.update:
+        return old
+    return new
+
+
+def add_pending(package_id: str, topic: Topic, profile: Profile) -> bool:
+    """Record topic of the package syndication for the profile.
+
+    If package already waits for syndication, topics are merged and
+    `False` is returned. `True` means that new syndication job must be
+    enqueued.
+
+    """
+    conn = connect_to_redis()
+    key = _pending_key(package_id)
+
+    def update(pipe: Any) -> bool:
+        now = int(time.time())
+        current = pipe.hget(key, profile.id)
+        pending = topic
+        scheduled_at = now
+        is_new = True
+        if current:
+            old_topic, old_scheduled_at = _parse_pending(current)
+            # stale record means that job was lost. Schedule a new one
+            if now - old_scheduled_at < get_debounce_window():
+                pending = merge_topics(old_topic, topic)
+                scheduled_at = old_scheduled_at
+                is_new = False
+
+        pipe.multi()
+        pipe.hset(key, profile.id, f"{pending.name}:{scheduled_at}")
+        pipe.expire(key, PENDING_TTL)
+        return is_new
+
+    # record may be popped by worker while it's updated. In this case
+    # transaction is repeated and new job is scheduled
+    return conn.transaction(update, key, value_from_callable=True)
+
+
+def pop_pending(package_id: str, profile: Profile) -> Optional[Topic]:
+    """Remove and return the pending topic of the package syndication."""
+    conn = connect_to_redis()
+    key = _pending_key(package_id)
+
+    with conn.pipeline() as pipe:
+        pipe.hget(key, profile.id)
+        pipe.hdel(key, profile.id)
+        current, _ = pipe.execute()
+
+    if not current:
+        return None
+
+    topic, _ = _parse_pending(current)
+    return topic
+
+
+def _pending_delete_key(profile: Profile) -> str:
+    return redis_key("pending-delete", profile.id)
+
+
+def _pending_delete_started_key(profile: Profile) -> str:
+    return redis_key("pending-delete-started", profile.id)
+
+
+def add_pending_delete(package_id: str, profile: Profile) -> bool:
+    """Add package to the batch of packages that must be removed remotely.
+
+    `True` means that new batch was started and deletion job must be
+    enqueued.
+
+    """
+    conn = connect_to_redis()
+    key = _pending_delete_key(profile)
+    started_key = _pending_delete_started_key(profile)
+    timeout = get_debounce_window() or PENDING_DELETE_TIMEOUT
+
+    def update(pipe: Any) -> bool:
+        now = int(time.time())
+        started = pipe.get(started_key)
+        # batch that is not processed for too long means that job was
+        # lost. Schedule a new one
+        is_new = started is None or now - int(started) >= timeout
+
+        pipe.multi()
+        pipe.sadd(key, package_id)
+        pipe.expire(key, PENDING_TTL)
+        if is_new:
+            pipe.set(started_key, now, ex=PENDING_TTL)
+        return is_new
+
+    return conn.transaction(update, started_key, value_from_callable=True)
+
+
+def pop_pending_deletes(profile: Profile) -> list[str]:
+    """Remove and return all packages that must be removed remotely."""
+    conn = connect_to_redis()
+    key = _pending_delete_key(profile)
+    with conn.pipeline() as pipe:
+        pipe.smembers(key)
+        pipe.delete(key, _pending_delete_started_key(profile))
+        ids, _ = pipe.execute()
+
+    return [id_.decode() if isinstance(id_, bytes) else id_ for id_ in ids]
+
+
+def _parse_pending(value: Any) -> tuple[Topic, int]:
+    if isinstance(value, bytes):
+        value = value.decode()
+    name, scheduled_at = value.split(":")
+    return Topic[name], int(scheduled_at)
+
+
 def prepare_profile_dict(profile: Profile) -> Profile:
     return profile
 
@@ -99,9 +383,358 @@ def _parse_profiles(config: dict[str, str]) -> Iterable[Profile]:
         yield Profile(id=id_, **data)
 
 
+Predicate = Callable[[Any], bool]
+
+
+class _Registry(NamedTuple):
+    profiles: tuple[Profile, ...]
+    by_id: dict[str, Profile]
+    predicates: dict[str, Predicate]
+
+
+_registry: Optional[_Registry] = None
+
+
+def reload_profiles(config=None) -> tuple[Profile, ...]:
+    """Parse syndication profiles from the config and cache them.
+
+    Called from `IConfigurable.configure`. Profiles are parsed lazily from
+    `tk.config` if this function was never called.
+
+    """
+    global _registry
+
+    if config is None:
+        config = tk.config
+
+    profiles = tuple(
+        prepare_profile_dict(profile)
+        for profile in syndicate_configs_from_config(config)
+    )
+    predicates = {
+        profile.id: _import_predicate(profile)
+        for profile in profiles
+        if profile.predicate
+    }
+    _registry = _Registry(profiles, {p.id: p for p in profiles}, predicates)
+    return profiles
+
+
+def _import_predicate(profile: Profile) -> Predicate:
+    try:
+        return import_string(profile.predicate)
+    except ImportError as e:
+        raise CkanConfigurationException(
+            f"Cannot import predicate {profile.predicate} of syndication"
+            f" profile {profile.id}: {e}"
+        ) from e
+
+
+def reset_profiles():
+    """Drop cached profiles, so that they are parsed again on the next access.
+
+    Call it whenever config options of profiles are changed at runtime.
+
+    """
+    global _registry
+    _registry = None
+
+
+def _get_registry() -> _Registry:
+    registry = _registry
+    if registry is None:
+        reload_profiles()
+        registry = _registry
+        assert registry is not None
+    return registry
+
+
 def get_syndicate_profiles() -> Iterator[Profile]:
-    for profile in syndicate_configs_from_config(tk.config):
-        yield prepare_profile_dict(profile)
+    return iter(_get_registry().profiles)
+
+
+def get_profile(id_: str) -> Optional[Profile]:
+    """Return cached profile with the given ID."""
+    return _get_registry().by_id.get(id_)
+
+
+def get_predicate(profile: Profile) -> Optional[Predicate]:
+    """Return imported predicate of the profile."""
+    if not profile.predicate:
+        return None
+
+    registry = _get_registry()
+    cached = registry.by_id.get(profile.id)
+    if cached and cached.predicate == profile.predicate:
+        return registry.predicates[profile.id]
+
+    # profile was created outside of the config(or before config
+    # changes). Not a hot path, so just import predicate again
+    return _import_predicate(profile)
+
+
+def invalidate_remote_organization(org_id: str):
+    """Forget cached IDs of the organization on remote portals."""
+    from .cache import get_org_cache, org_cache_key
+
+    org_cache = get_org_cache()
+    for profile in get_syndicate_profiles():
+        org_cache.delete(org_cache_key(profile.id, org_id))
+
+
+# fields that are changed on every modification of the local dataset, but
+# are ignored or recomputed by the remote portal
+VOLATILE_FIELDS = frozenset(
+    [
+        "metadata_created",
+        "metadata_modified",
+        "revision_id",
+        "num_resources",
+        "num_tags",
+        "tracking_summary",
+    ]
+)
+
+
+def compute_payload_hash(payload: dict[str, Any]) -> str:
+    """Compute fingerprint of the data sent to the remote portal."""
+    significant = {
+        k: v for k, v in payload.items() if k not in VOLATILE_FIELDS
+    }
+    serialized = json.dumps(significant, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def get_payload_hash(package_id: str, profile: Profile) -> Optional[str]:
+    """Return hash of the data sent to the remote portal last time."""
+    state = SyncState.get(package_id, profile.id)
+    return state.payload_hash if state else None
+
+
+def drop_payload_hash(package_id: str, profile: Profile):
+    """Force syndication of the package even if it was not changed."""
+    state = SyncState.get(package_id, profile.id)
+    if state and state.payload_hash:
+        state.payload_hash = None
+        ckan_model.Session.commit()
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse timestamp, returned by CKAN API or by Solr."""
+    if not value:
+        return None
+    value = value.rstrip("Z")
+    if "." in value:
+        # Solr strips trailing zeros of milliseconds
+        value, fraction = value.split(".", 1)
+        value += "." + fraction.ljust(6, "0")[:6]
+    return datetime.datetime.fromisoformat(value)
+
+
+def count_skipped_write(profile: Profile):
+    from . import metrics
+
+    connect_to_redis().hincrby(redis_key("skipped-writes"), profile.id, 1)
+    metrics.incr("skipped_writes", profile=profile.id)
+
+
+def get_skipped_writes() -> dict[str, int]:
+    """Number of unchanged packages that were not sent to remote portal."""
+    stats = connect_to_redis().hgetall(redis_key("skipped-writes"))
+    return {
+        (k.decode() if isinstance(k, bytes) else k): int(v)
+        for k, v in stats.items()
+    }
+
+
+def defer_syndication(
+    package_id: str, topic: Topic, profile: Profile, delay: float
+):
+    """Postpone syndication, until `ckan syndicate resume` is called."""
+    state = SyncState.get_or_create(package_id, profile.id)
+    if state.deferred_topic:
+        topic = merge_topics(Topic[state.deferred_topic], topic)
+    state.defer(topic.name, delay)
+    ckan_model.Session.commit()
+
+
+def get_retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, so that retries are spread."""
+    base = float(
+        tk.config.get(CONFIG_RETRY_BASE_DELAY, DEFAULT_RETRY_BASE_DELAY)
+    )
+    limit = float(
+        tk.config.get(CONFIG_RETRY_MAX_DELAY, DEFAULT_RETRY_MAX_DELAY)
+    )
+    delay = min(limit, base * 2 ** max(attempt - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_syndication(
+    package_id: str,
+    topic: Topic,
+    profile: Profile,
+    error: Exception,
+    transient: bool = True,
+) -> bool:
+    """Schedule the next attempt of the failed syndication.
+
+    Attempts are resumed by `ckan syndicate resume`. When the error is not
+    transient or attempts are exhausted, syndication is moved to the
+    dead-letter store and `False` is returned.
+
+    """
+    state = SyncState.get_or_create(package_id, profile.id)
+    if state.deferred_topic:
+        topic = merge_topics(Topic[state.deferred_topic], topic)
+
+    state.attempts = (state.attempts or 0) + 1
+    reason = "{}: {}".format(type(error).__name__, error)[:MAX_ERROR_LENGTH]
+
+    max_attempts = tk.asint(
+        tk.config.get(CONFIG_RETRY_MAX_ATTEMPTS, DEFAULT_RETRY_MAX_ATTEMPTS)
+    )
+    if not transient or state.attempts > max_attempts:
+        state.fail(topic.name, reason)
+        ckan_model.Session.commit()
+        return False
+
+    state.last_error = reason
+    state.defer(topic.name, get_retry_delay(state.attempts))
+    ckan_model.Session.commit()
+    return True
+
+
+def failed_syndications_query(
+    package_ids: Optional[Iterable[str]] = None,
+    profile_id: Optional[str] = None,
+    error: Optional[str] = None,
+) -> Any:
+    """Query syndications in the dead-letter store, oldest first."""
+    query = ckan_model.Session.query(SyncState).filter(
+        SyncState.failed_at.isnot(None)
+    )
+    if package_ids is not None:
+        query = query.filter(SyncState.package_id.in_(list(package_ids)))
+    if profile_id:
+        query = query.filter(SyncState.profile_id == profile_id)
+    if error:
+        query = query.filter(SyncState.last_error.contains(error))
+    return query.order_by(SyncState.failed_at)
+
+
+def replay_failed(query: Any, batch_size: int = STATE_BATCH_SIZE) -> int:
+    """Enqueue failed syndications from the query.
+
+    Failure is removed from the dead-letter store only after syndication
+    is enqueued, so it can be replayed again if job queue is unavailable.
+
+    Returns the number of replayed syndications.
+
+    """
+    replayed = 0
+    for state in _iter_states(query, SyncState.failed_at, batch_size):
+        profile = get_profile(state.profile_id)
+        if not profile:
+            log.warning(
+                "Profile %s does not exist anymore. Skip replay of %s",
+                state.profile_id,
+                state.package_id,
+            )
+            continue
+
+        topic = Topic[state.deferred_topic or Topic.update.name]
+        failed_at = state.failed_at
+        syndicate_dataset(state.package_id, topic, profile)
+
+        _reset_state(
+            state,
+            SyncState.failed_at == failed_at,
+            deferred_topic=None,
+            failed_at=None,
+            attempts=0,
+        )
+        replayed += 1
+
+    return replayed
+
+
+def resume_deferred(batch_size: int = STATE_BATCH_SIZE) -> int:
+    """Enqueue deferred syndications that are ready for the next attempt.
+
+    Deferred state is cleared only after syndication is enqueued. If job
+    queue is unavailable, error is raised and remaining syndications are
+    resumed by the next call.
+
+    Returns the number of resumed syndications.
+
+    """
+    now = datetime.datetime.utcnow()
+    query = ckan_model.Session.query(SyncState).filter(
+        SyncState.next_attempt_at <= now
+    )
+
+    resumed = 0
+    for state in _iter_states(query, SyncState.next_attempt_at, batch_size):
+        topic = Topic[state.deferred_topic or Topic.update.name]
+        attempt_at = state.next_attempt_at
+        profile = get_profile(state.profile_id)
+
+        if profile:
+            syndicate_dataset(state.package_id, topic, profile)
+            resumed += 1
+        else:
+            log.warning(
+                "Profile %s does not exist anymore. Drop deferred"
+                " syndication of %s",
+                state.profile_id,
+                state.package_id,
+            )
+
+        _reset_state(
+            state,
+            SyncState.next_attempt_at == attempt_at,
+            deferred_topic=None,
+            next_attempt_at=None,
+        )
+
+    return resumed
+
+
+def _iter_states(
+    query: Any, column: Any, batch_size: int
+) -> Iterator[SyncState]:
+    """Iterate over sync states from the query, one batch at a time."""
+    order = (column, SyncState.package_id, SyncState.profile_id)
+    query = query.order_by(None).order_by(*order)
+
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            page = page.filter(sa.tuple_(*order) > sa.tuple_(*last))
+        states = page.limit(batch_size).all()
+        if not states:
+            return
+
+        # states are expired by commits made while batch is processed
+        last = (
+            getattr(states[-1], column.key),
+            states[-1].package_id,
+            states[-1].profile_id,
+        )
+        yield from states
+
+
+def _reset_state(state: SyncState, unchanged: Any, **values: Any):
+    # enqueued job may finish and defer syndication again before the state
+    # is reset. Such changes must be kept.
+    ckan_model.Session.query(SyncState).filter(
+        SyncState.package_id == state.package_id,
+        SyncState.profile_id == state.profile_id,
+        unchanged,
+    ).update(values, synchronize_session=False)
+    ckan_model.Session.commit()
 
 
 def try_sync(id_):
@@ -111,3 +744,5 @@ def try_sync(id_):
     if not pkg:
         return
     plugin.notify(pkg, "changed")
+    # syndication may be recorded in the outbox
+    ckan_model.Session.commit()
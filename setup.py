@@ -57,6 +57,9 @@ setup(
         "ckanapi",
         "blinker",
     ],
+    extras_require={
+        "async": ["httpx"],
+    },
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.